@@ -2,6 +2,23 @@
 ASGI config for Online_Invoicing project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+HTTP requests go to Django and ``ws/room/<room_hash>/`` sockets go to
+``invoicing_app.consumers.NegotiationConsumer``, so one server process
+serves both.
+
+Run it with any ASGI server, for example::
+
+    uvicorn Online_Invoicing.asgi:application --host 0.0.0.0 --port 8000 --workers 4
+
+``manage.py runserver`` serves the same application through Daphne.
+
+With more than one worker (or host), set ``CHANNEL_REDIS_URL`` so the
+workers share a Redis channel layer; otherwise an in-process layer is used
+and pushes only reach sockets held by the same process.
+
+Behind a reverse proxy, set ``LOGIN_THROTTLE_IP_HEADER`` to the META key the
+proxy puts the client address in (``HTTP_X_REAL_IP``, the default, on
+PythonAnywhere); otherwise every visitor shares the proxy's login limit.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -9,20 +26,26 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 
 import os
 from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Online_Invoicing.settings')
+
+# Set up Django before importing anything that touches models.
+django_asgi_app = get_asgi_application()
+
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
+from channels.security.websocket import AllowedHostsOriginValidator
 from invoicing_app.invoice_routing import websocket_urlpatterns
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Online_Invoicing.settings')
-
+# Sockets act as the seller on the strength of the session cookie, so only
+# pages served from ALLOWED_HOSTS may open them
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
-    "websocket": AuthMiddlewareStack(
-        URLRouter(
-            websocket_urlpatterns
+    "http": django_asgi_app,
+    "websocket": AllowedHostsOriginValidator(
+        AuthMiddlewareStack(
+            URLRouter(
+                websocket_urlpatterns
+            )
         )
     ),
 })
-
-application = get_asgi_application()
-
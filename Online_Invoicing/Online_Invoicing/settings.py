@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -31,6 +32,7 @@ ALLOWED_HOSTS = ['nontaxinvoiceproof.pythonanywhere.com']
 # Application definition
 
 INSTALLED_APPS = [
+    'daphne',  # ASGI runserver, so WebSockets work in development too
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -38,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     
+    'channels',
     'rest_framework',
     'invoicing_app',
     'corsheaders',
@@ -89,18 +92,177 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'Online_Invoicing.wsgi.application'
+ASGI_APPLICATION = 'Online_Invoicing.asgi.application'
 
 
-# Database
-# https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+# Channel layer used to push room state to negotiation sockets.
+# Set CHANNEL_REDIS_URL (e.g. redis://127.0.0.1:6379/0) when running more than
+# one ASGI worker; the in-memory layer only reaches sockets in the same process.
 
-# settings.py
+CHANNEL_REDIS_URL = os.environ.get('CHANNEL_REDIS_URL')
+
+if CHANNEL_REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [CHANNEL_REDIS_URL],
+                'capacity': int(os.environ.get('CHANNEL_CAPACITY', 1500)),
+                'expiry': int(os.environ.get('CHANNEL_EXPIRY', 10)),
+            },
+        },
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        },
+    }
+
+
+# Client messages on the room socket (invoicing_app.ws_protocol): at most
+# WS_MESSAGE_RATE = (messages, seconds) per connection, typing and presence
+# broadcast at most once per WS_COALESCE_INTERVAL seconds.
+
+WS_MESSAGE_RATE = (30, 10)
+WS_COALESCE_INTERVAL = 1.0
+WS_MAX_MESSAGE_BYTES = 1024
+
+
+# Django caches. Set CACHE_REDIS_URL to share them between workers; the
+# local-memory cache is per process and is what the test suite runs against.
+# The 'verification' alias holds pending verification counts apart from the
+# culled room state.
+
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+        },
+        'verification': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+            'KEY_PREFIX': 'verification',
+        },
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        },
+        'verification': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'verification',
+            'OPTIONS': {'MAX_ENTRIES': 2 ** 31},
+        },
+    }
+
+# Serialized room state (invoicing_app.room_cache). Only on with a shared
+# cache: write paths invalidate the copy in their own cache, so per-process
+# caches would keep serving stale rooms (and versions) from other workers.
+
+ROOM_STATE_CACHE = 'default' if CACHE_REDIS_URL else None
+ROOM_STATE_CACHE_TIMEOUT = 300
+
+# Count encrypted-invoice verifications in the cache and add them to the rows
+# in batches (invoicing_app.verification_counter) instead of one UPDATE per
+# scan. Only on with a shared cache: a per-process cache loses its counts on
+# restart and is invisible to `manage.py flush_verification_counts`, which
+# should run from cron to pick up counts left by stopped workers.
+
+VERIFICATION_WRITE_BEHIND = bool(CACHE_REDIS_URL)
+VERIFICATION_COUNTER_CACHE = 'verification'
+VERIFICATION_FLUSH_INTERVAL = 30
+
+# Failed seller logins allowed per sliding window, as (failures, seconds), for
+# each client IP and each session (invoicing_app.throttle). The client IP is
+# read from the META key LOGIN_THROTTLE_IP_HEADER, falling back to REMOTE_ADDR
+# when the request lacks it. The default suits PythonAnywhere, whose proxy sets
+# X-Real-IP; behind it REMOTE_ADDR is the proxy, shared by every visitor. Set
+# the variable to the proxy's header elsewhere, or to '' when clients connect
+# directly, since the header can then be forged.
+
+LOGIN_THROTTLE_RATES = {
+    'ip': (20, 300),
+    'session': (5, 300),
+}
+LOGIN_THROTTLE_IP_HEADER = os.environ.get('LOGIN_THROTTLE_IP_HEADER', 'HTTP_X_REAL_IP') or None
+LOGIN_THROTTLE_CACHE = 'default'
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',   # Database backend
-        'NAME': BASE_DIR / 'db.sqlite3',          # Database file location
+# Lifetime in seconds of the seller capability tokens embedded in the seller
+# room pages (invoicing_app.capabilities). Pages reload to pick up a fresh
+# token for the session once it has expired.
+
+SELLER_TOKEN_MAX_AGE = 7200
+
+# Sellers created before secret key fingerprints existed can only be found by
+# hashing the key against each of them, and are fingerprinted on their next
+# successful login. Each wrong key costs one password hash per such row, within
+# the login throttle above. Set SELLER_LEGACY_KEY_SCAN=0 once
+# `manage.py legacy_seller_keys` reports none are left.
+
+SELLER_LEGACY_KEY_SCAN = os.environ.get('SELLER_LEGACY_KEY_SCAN', '1') != '0'
+
+
+# Database
+# https://docs.djangoproject.com/en/5.2/ref/settings/#databases
+#
+# DB_ENGINE=postgres selects PostgreSQL (POSTGRES_DB, POSTGRES_USER,
+# POSTGRES_PASSWORD, POSTGRES_HOST, POSTGRES_PORT). Connections are kept for
+# DB_CONN_MAX_AGE seconds and health-checked before reuse. DB_POOL=1 switches
+# to Django's connection pool instead, which needs Django 5.1+ and psycopg 3
+# (pip install "psycopg[pool]").
+#
+# The default is SQLite for single-node setups, tuned by SQLITE_PRAGMAS
+# (applied by invoicing_app.db on every new connection) and a busy timeout
+# so writers wait for the lock instead of failing with "database is locked".
+
+DB_ENGINE = os.environ.get('DB_ENGINE', 'sqlite')
+
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'online_invoicing'),
+            'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': int(os.environ.get('DB_CONNECT_TIMEOUT', 5)),
+            },
+        }
+    }
+    if os.environ.get('DB_POOL'):
+        # Pooled connections are returned after every request, so they must not also persist
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+            'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # Seconds a connection waits for the write lock
+                'timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', 20)),
+            },
+        }
     }
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
 }
 
 
@@ -147,6 +309,46 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
 
+# Largest number of line items accepted by the multi-item invoice form
+
+MAX_INVOICE_ITEMS = 200
+
+
+# Encrypted invoice verification: in-process cache of PBKDF2-derived keys
+# (see invoicing_app.encryption_utils.DerivedKeyCache). Size 0 disables it.
+
+INVOICE_KEY_CACHE_SIZE = 256
+INVOICE_KEY_CACHE_TTL = 300  # seconds
+
+# Rendered proof-of-transaction PDFs are cached under proofs/<room_hash>/ in
+# this entry of STORAGES (see invoicing_app.reports.pdf_cache).
+
+PROOF_PDF_STORAGE = 'default'
+
+# Queue a background render of the proof PDF when a seller confirms payment
+# (invoicing_app.reports.prerender). PROOF_PDF_BASE_URL is the verification
+# host encoded in every proof PDF, whichever host the request came in on, so
+# pre-rendered and downloaded copies share one cache entry. Leave it empty to
+# use the request host instead.
+
+PROOF_PDF_PRERENDER = False
+PROOF_PDF_PRERENDER_WORKERS = 2
+PROOF_PDF_PRERENDER_QUEUE = 32
+PROOF_PDF_BASE_URL = os.environ.get('PROOF_PDF_BASE_URL', 'https://nontaxinvoiceproof.pythonanywhere.com')
+
+# Bulk ZIP export of proofs for staff users (POST /api/proofs/export/)
+
+PROOF_EXPORT_MAX_ROOMS = 1000
+PROOF_EXPORT_WORKERS = 4
+
+# Room payloads and proof pages embed only the latest history entries; older
+# ones are paged from /api/room/<room_hash>/history/
+
+ROOM_HISTORY_EMBED_LIMIT = 20
+HISTORY_PAGE_SIZE = 20
+HISTORY_PAGE_MAX_SIZE = 100
+
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -0,0 +1,147 @@
+"""
+Benchmark the hot history and finalized-invoice lookups as the tables grow.
+
+Builds a throwaway SQLite database, migrates it, and grows it to each size
+in ``--sizes``. At every size it times the queries behind room detail
+history, proof pages and the proof export, and prints the plan SQLite
+picks, so index regressions show up as times that grow with the table.
+
+    python benchmarks/bench_hot_queries.py --sizes 10000,100000,1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "Online_Invoicing.settings")
+
+BATCH = 20000
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="10000,100000,1000000",
+                        help="Comma-separated row counts per history table")
+    parser.add_argument("--repeat", type=int, default=200, help="Timed runs per query")
+    return parser.parse_args()
+
+
+def setup_database(path):
+    from django.conf import settings
+
+    settings.DATABASES["default"]["NAME"] = path
+    import django
+
+    django.setup()
+    from django.core.management import call_command
+
+    call_command("migrate", verbosity=0)
+
+
+def grow(target_rows, state):
+    """Add rooms, invoices and history rows until each history table holds ``target_rows``"""
+    from invoicing_app.models import Room, Invoice, NegotiationHistory, MultiItemNegotiationHistory
+
+    rng = state["rng"]
+    base = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+    while state["rows"] < target_rows:
+        count = min(BATCH, target_rows - state["rows"])
+        rooms = [
+            Room(id=uuid.uuid4(), room_hash=uuid.uuid4().hex[:16], verification_key=uuid.uuid4().hex)
+            for _ in range(count // 10 or 1)
+        ]
+        Room.objects.bulk_create(rooms)
+        Invoice.objects.bulk_create([
+            Invoice(
+                room=room,
+                invoice_date=date(2024, 1, 1),
+                description="Benchmark",
+                quantity=1,
+                unit_price=1,
+                line_total=1,
+                payment_method="cash",
+                status=rng.choice(["draft", "pending", "finalized", "finalized"]),
+                seller_confirmed_at=base + timedelta(minutes=rng.randrange(525600)),
+            )
+            for room in rooms
+        ])
+        state["room_ids"].extend(room.id for room in rooms)
+
+        for model in (NegotiationHistory, MultiItemNegotiationHistory):
+            rows = [
+                model(room_id=rng.choice(state["room_ids"]), action="edited", actor="seller")
+                for _ in range(count)
+            ]
+            model.objects.bulk_create(rows)
+        state["rows"] += count
+
+    if state.get("target_room") is None:
+        state["target_room"] = state["room_ids"][0]
+
+
+def timed(queryset, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        list(queryset.all())
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def plan(queryset):
+    from django.db import connection
+
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        return "; ".join(row[-1] for row in cursor.fetchall())
+
+
+def queries(state):
+    from invoicing_app.models import Invoice, NegotiationHistory, MultiItemNegotiationHistory
+
+    room_id = state["target_room"]
+    day = datetime(2024, 6, 1, tzinfo=dt_timezone.utc)
+    return {
+        "history latest 20": NegotiationHistory.objects.filter(room_id=room_id).order_by("-created_at")[:20],
+        "multi history latest 20": MultiItemNegotiationHistory.objects.filter(room_id=room_id).order_by("-created_at")[:20],
+        "finalized latest 50": Invoice.objects.filter(status="finalized").order_by("-seller_confirmed_at")[:50],
+        "finalized in one day": Invoice.objects.filter(
+            status="finalized", seller_confirmed_at__range=(day, day + timedelta(days=1))
+        ).values_list("room_id", flat=True),
+    }
+
+
+def main():
+    args = parse_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        setup_database(os.path.join(tmp, "bench.sqlite3"))
+        state = {"rows": 0, "room_ids": [], "rng": random.Random(42), "target_room": None}
+
+        results = {}
+        for size in sizes:
+            grow(size, state)
+            for name, queryset in queries(state).items():
+                results.setdefault(name, {"plan": plan(queryset)})[size] = timed(queryset, args.repeat)
+
+        header = f"{'query':<26}" + "".join(f"{size:>12,}" for size in sizes)
+        print(header)
+        print("-" * len(header))
+        for name, row in results.items():
+            print(f"{name:<26}" + "".join(f"{row[size]:>10.3f}ms" for size in sizes))
+        print()
+        for name, row in results.items():
+            print(f"{name}: {row['plan']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Load-test the database profiles from settings.py against the room API.
+
+Each mode runs in its own process with the matching environment. Worker
+threads drive the real views through Django's test client, so request
+signals open, reuse or pool connections exactly as they would under a server.
+The mix is mostly room reads, the rest seller edits, which carry a seller
+token and go through the state machine and write history. Edits count as
+errors unless they return 200 or lose a version race with 409.
+
+    python benchmarks/load_test_db.py --modes sqlite-untuned,sqlite
+    POSTGRES_DB=scratch POSTGRES_USER=... python benchmarks/load_test_db.py
+
+The postgres and postgres-pool modes migrate and write to POSTGRES_DB, so
+point it at a scratch database. postgres-pool needs Django 5.1+ and
+psycopg 3 ("psycopg[pool]").
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+MODES = {
+    # Stock SQLite: rollback journal, full fsync, 5 second busy timeout
+    "sqlite-untuned": {"DB_ENGINE": "sqlite", "SQLITE_BUSY_TIMEOUT": "5", "LOADTEST_SQLITE_PRAGMAS": "{}"},
+    "sqlite": {"DB_ENGINE": "sqlite"},
+    "postgres": {"DB_ENGINE": "postgres"},
+    "postgres-pool": {"DB_ENGINE": "postgres", "DB_POOL": "1"},
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--modes", default="sqlite-untuned,sqlite,postgres,postgres-pool")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=15, help="Seconds of load per mode")
+    parser.add_argument("--rooms", type=int, default=200)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def setup_django():
+    sys.path.insert(0, str(ROOT))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "Online_Invoicing.settings")
+    from django.conf import settings
+
+    settings.ALLOWED_HOSTS = ["testserver"]
+    # Every read must reach the database, not the room state cache
+    settings.CACHES = {"default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}}
+    if "LOADTEST_SQLITE_PRAGMAS" in os.environ:
+        settings.SQLITE_PRAGMAS = json.loads(os.environ["LOADTEST_SQLITE_PRAGMAS"])
+
+    import django
+
+    django.setup()
+    from django.core.management import call_command
+
+    call_command("migrate", verbosity=0)
+
+
+def seed(count):
+    from invoicing_app.invoice_services import create_room_with_invoice
+
+    return [
+        create_room_with_invoice(
+            {"fullname": f"Seller {i}"},
+            {
+                "invoice_date": date(2025, 1, 1),
+                "description": "Load test",
+                "quantity": 1,
+                "unit_price": 10,
+                "payment_method": "cash",
+            },
+        ).room_hash
+        for i in range(count)
+    ]
+
+
+def run_worker(args):
+    setup_django()
+    from django.db import connections
+    from django.test import Client
+    from invoicing_app.capabilities import issue_seller_token
+
+    room_hashes = seed(args.rooms)
+    seller_tokens = {room_hash: issue_seller_token(room_hash) for room_hash in room_hashes}
+    deadline = time.monotonic() + args.duration
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def worker(seed_value):
+        rng = random.Random(seed_value)
+        client = Client()
+        local_latencies, local_errors = [], 0
+        while time.monotonic() < deadline:
+            room_hash = rng.choice(room_hashes)
+            start = time.perf_counter()
+            try:
+                if rng.random() < args.write_ratio:
+                    response = client.put(
+                        f"/api/seller/{room_hash}/edit-single-invoice/",
+                        {"quantity": rng.randint(1, 50)},
+                        content_type="application/json",
+                        HTTP_X_SELLER_TOKEN=seller_tokens[room_hash],
+                    )
+                    ok = response.status_code in (200, 409)
+                else:
+                    ok = client.get(f"/api/room/{room_hash}/").status_code == 200
+            except Exception:
+                ok = False
+            local_latencies.append((time.perf_counter() - start) * 1000)
+            local_errors += not ok
+        connections.close_all()
+        with lock:
+            latencies.extend(local_latencies)
+            errors.append(local_errors)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    print(json.dumps({
+        "requests": len(latencies),
+        "errors": sum(errors),
+        "rps": len(latencies) / elapsed,
+        "p50": statistics.median(latencies) if latencies else 0,
+        "p95": latencies[int(len(latencies) * 0.95) - 1] if latencies else 0,
+    }))
+
+
+def run_mode(mode, args, tmp):
+    env = {**os.environ, **MODES[mode]}
+    if env["DB_ENGINE"] == "sqlite":
+        env["SQLITE_PATH"] = os.path.join(tmp, f"{mode}.sqlite3")
+    elif not os.environ.get("POSTGRES_DB"):
+        return {"skipped": "POSTGRES_DB not set"}
+
+    command = [
+        sys.executable, __file__, "--worker", mode,
+        "--threads", str(args.threads), "--duration", str(args.duration),
+        "--rooms", str(args.rooms), "--write-ratio", str(args.write_ratio),
+    ]
+    result = subprocess.run(command, env=env, capture_output=True, text=True)
+    if result.returncode:
+        return {"skipped": result.stderr.strip().splitlines()[-1]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    args = parse_args()
+    if args.worker:
+        run_worker(args)
+        return
+
+    modes = args.modes.split(",")
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {mode: run_mode(mode, args, tmp) for mode in modes}
+
+    print(f"{args.threads} threads, {args.duration:g}s per mode, {args.write_ratio:.0%} writes")
+    header = f"{'mode':<16}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for mode, row in results.items():
+        if "skipped" in row:
+            print(f"{mode:<16}skipped: {row['skipped']}")
+            continue
+        print(
+            f"{mode:<16}{row['requests']:>10}{row['errors']:>8}{row['rps']:>10.1f}"
+            f"{row['p50']:>10.2f}{row['p95']:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,12 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class InvoicingAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'invoicing_app'
+
+    def ready(self):
+        from .db import apply_sqlite_pragmas
+
+        connection_created.connect(apply_sqlite_pragmas, dispatch_uid='invoicing_app.sqlite_pragmas')
@@ -0,0 +1,84 @@
+"""
+Authorization for the seller and buyer endpoints.
+
+Sellers hold signed, short-lived capability tokens. A token names one room
+and is issued once the seller has proven the secret key and room hash.
+Seller API views accept it from the X-Seller-Token header. Verifying it is
+one HMAC over the token and needs no password hashing or database query.
+
+Buyers prove themselves with their buyer_hash. The room and buyer are
+loaded together in one query through the unique buyer_hash index.
+"""
+import functools
+import hmac
+
+from django.conf import settings
+from django.core import signing
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import Room
+
+SALT = 'invoicing_app.seller_capability'
+HEADER = 'X-Seller-Token'
+
+
+def issue_seller_token(room_hash):
+    return signing.dumps({'room': room_hash}, salt=SALT)
+
+
+def verify_seller_token(token, room_hash):
+    """True if ``token`` is a current seller token for ``room_hash``"""
+    if not token:
+        return False
+    try:
+        payload = signing.loads(token, salt=SALT, max_age=getattr(settings, 'SELLER_TOKEN_MAX_AGE', 7200))
+    except signing.BadSignature:
+        return False
+    return hmac.compare_digest(str(payload.get('room', '')), room_hash)
+
+
+def grant_seller_room(request, room_hash):
+    """Remember in the session that this client may act as the seller of ``room_hash``"""
+    request.session['authenticated_room_hash'] = room_hash
+
+
+def session_seller_token(request, room_hash):
+    """A fresh token when the session is authenticated for ``room_hash``, else None"""
+    if request.session.get('authenticated_room_hash') != room_hash:
+        return None
+    return issue_seller_token(room_hash)
+
+
+def seller_token_required(view):
+    """Reject requests to a ``room_hash`` seller view without a valid capability token"""
+    @functools.wraps(view)
+    def wrapper(request, room_hash, *args, **kwargs):
+        if not verify_seller_token(request.headers.get(HEADER), room_hash):
+            return Response({'error': 'Seller authorization required'}, status=status.HTTP_403_FORBIDDEN)
+        return view(request, room_hash, *args, **kwargs)
+    return wrapper
+
+
+def load_buyer_room(room_hash, buyer_hash):
+    """Return the room ``buyer_hash`` belongs to, with parties joined, or None"""
+    if not isinstance(buyer_hash, str) or not buyer_hash:
+        return None
+    room = Room.objects.with_parties().filter(room_hash=room_hash, buyer__buyer_hash=buyer_hash).first()
+    if room is None or not hmac.compare_digest(room.buyer.buyer_hash, buyer_hash):
+        return None
+    return room
+
+
+def buyer_required(view):
+    """Authorize a buyer action by the ``buyer_hash`` in the request body.
+
+    The view is called as ``view(request, room, buyer)``.
+    """
+    @functools.wraps(view)
+    def wrapper(request, room_hash, *args, **kwargs):
+        room = load_buyer_room(room_hash, request.data.get('buyer_hash'))
+        if room is None:
+            return Response({'error': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
+        return view(request, room, room.buyer, *args, **kwargs)
+    return wrapper
@@ -1,12 +1,33 @@
+import asyncio
 import json
+import time
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
+from . import ws_protocol
+from .capabilities import load_buyer_room
 from .models import Room, NegotiationHistory
+from .realtime import room_group_name
 
 class NegotiationConsumer(AsyncWebsocketConsumer):
+    """Room socket: server pushes room state, parties exchange ws_protocol messages.
+
+    A connection speaks as the seller when its session was granted the room,
+    or as the buyer when ``?buyer_hash=`` matches; anyone else only listens.
+    Relayed messages carry that role as ``actor``. Client messages are
+    limited to WS_MESSAGE_RATE per connection, and each type is broadcast
+    at most once per WS_COALESCE_INTERVAL with the latest payload.
+    Senders do not get their own messages back.
+    """
     async def connect(self):
         self.room_hash = self.scope['url_route']['kwargs']['room_hash']
-        self.room_group_name = f'negotiation_{self.room_hash}'
+        self.room_group_name = room_group_name(self.room_hash)
+        self.window_start, self.window_count = time.monotonic(), 0
+        self.last_broadcast = {}
+        self.pending = {}
+        self.flush_tasks = {}
+        self.role = await self.get_role()
 
         await self.channel_layer.group_add(
             self.room_group_name,
@@ -22,25 +43,72 @@ class NegotiationConsumer(AsyncWebsocketConsumer):
         }))
 
     async def disconnect(self, close_code):
+        for task in self.flush_tasks.values():
+            task.cancel()
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
 
-    async def receive(self, text_data):
-        data = json.loads(text_data)
-        message_type = data.get('type')
+    async def receive(self, text_data=None, bytes_data=None):
+        # Count every frame, valid or not, so junk cannot bypass the limit
+        if not self.allow_message() or self.role is None:
+            return
+        max_bytes = getattr(settings, 'WS_MAX_MESSAGE_BYTES', ws_protocol.DEFAULT_MAX_BYTES)
+        message = ws_protocol.parse(text_data, max_bytes)
+        if message is None:
+            return
+
+        await self.coalesce(message['type'], json.dumps({**message, 'actor': self.role}))
+
+    def allow_message(self):
+        limit, window = getattr(settings, 'WS_MESSAGE_RATE', (30, 10))
+        now = time.monotonic()
+        if now - self.window_start >= window:
+            self.window_start, self.window_count = now, 0
+        self.window_count += 1
+        return self.window_count <= limit
+
+    async def coalesce(self, kind, text):
+        interval = getattr(settings, 'WS_COALESCE_INTERVAL', 1.0)
+        last = self.last_broadcast.get(kind)
+        wait = 0 if last is None else last + interval - time.monotonic()
+        if wait <= 0 and kind not in self.flush_tasks:
+            self.last_broadcast[kind] = time.monotonic()
+            await self.broadcast(text)
+            return
+        # Later messages in the interval replace the pending one
+        self.pending[kind] = text
+        if kind not in self.flush_tasks:
+            self.flush_tasks[kind] = asyncio.ensure_future(self.flush_later(kind, wait))
 
+    async def flush_later(self, kind, delay):
+        await asyncio.sleep(delay)
+        del self.flush_tasks[kind]
+        self.last_broadcast[kind] = time.monotonic()
+        await self.broadcast(self.pending.pop(kind))
+
+    async def broadcast(self, text):
         await self.channel_layer.group_send(
             self.room_group_name,
-            {
-                'type': 'negotiation_update',
-                'message': data
-            }
+            {'type': 'room.push', 'text': text, 'sender': self.channel_name}
         )
 
-    async def negotiation_update(self, event):
-        await self.send(text_data=json.dumps(event['message']))
+    async def room_push(self, event):
+        if event.get('sender') == self.channel_name:
+            return
+        await self.send(text_data=event['text'])
+
+    @database_sync_to_async
+    def get_role(self):
+        session = self.scope.get('session')
+        if session is not None and session.get('authenticated_room_hash') == self.room_hash:
+            return 'seller'
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        buyer_hash = query.get('buyer_hash', [None])[0]
+        if load_buyer_room(self.room_hash, buyer_hash) is not None:
+            return 'buyer'
+        return None
 
     @database_sync_to_async
     def get_room_data(self):
@@ -12,6 +12,7 @@ from django.db import transaction
 import json
 
 from .models import Room, Invoice, Seller, Buyer, EncryptedInvoiceRecord
+from . import verification_counter
 from .encryption_utils import (
     InvoiceEncryption,
     prepare_seller_data,
@@ -29,7 +30,7 @@ from .encrypted_data_serializers import (
 @transaction.atomic
 def create_encrypted_invoice(request, room_hash):
     try:
-        room = get_object_or_404(Room, room_hash=room_hash)
+        room = get_object_or_404(Room.objects.with_parties(), room_hash=room_hash)
         invoice = get_object_or_404(Invoice, room=room, status='finalized')
         seller = get_object_or_404(Seller, room=room)
         buyer = get_object_or_404(Buyer, room=room)
@@ -46,17 +47,20 @@ def create_encrypted_invoice(request, room_hash):
         invoice_data = prepare_invoice_data(invoice)
         items_data = prepare_items_data(invoice)
         
-        encrypted_seller = InvoiceEncryption.encrypt_data(seller_data, room_hash)
-        encrypted_buyer = InvoiceEncryption.encrypt_data(buyer_data, room_hash)
-        encrypted_invoice = InvoiceEncryption.encrypt_data(invoice_data, room_hash)
-        encrypted_items = InvoiceEncryption.encrypt_data(items_data, room_hash)
+        encrypted = InvoiceEncryption.encrypt_sections({
+            'seller': seller_data,
+            'buyer': buyer_data,
+            'invoice': invoice_data,
+            'items': items_data,
+        }, room_hash)
         
-        encrypted_record = EncryptedInvoiceRecord.objects.create(
+        encrypted_record = EncryptedInvoiceRecord(
             room=room,
-            encrypted_seller_data=encrypted_seller,
-            encrypted_buyer_data=encrypted_buyer,
-            encrypted_invoice_data=encrypted_invoice,
-            encrypted_items_data=encrypted_items,
+            encrypted_seller_data=encrypted['seller'],
+            encrypted_buyer_data=encrypted['buyer'],
+            encrypted_invoice_data=encrypted['invoice'],
+            encrypted_items_data=encrypted['items'],
+            format_version=EncryptedInvoiceRecord.FORMAT_V2,
         )
         
         encrypted_record.data_hash = encrypted_record.generate_data_hash()
@@ -107,7 +111,7 @@ def view_encrypted_invoice(request, id):
             'data_hash': encrypted_record.data_hash,
             'verification_signature': encrypted_record.verification_signature,
             'finalized_at': encrypted_record.finalized_at,
-            'verification_count': encrypted_record.verification_count,
+            'verification_count': verification_counter.current(encrypted_record)[0],
 
             'history': room.history.all(),
             'multi_item_history': room.multi_item_history.all(),
@@ -127,7 +131,7 @@ def view_encrypted_invoice(request, id):
 @api_view(['POST'])
 def decrypt_invoice_api(request, room_hash):
     try:
-        room = get_object_or_404(Room, room_hash=room_hash)
+        room = get_object_or_404(Room.objects.with_parties(), room_hash=room_hash)
         encrypted_record = get_object_or_404(EncryptedInvoiceRecord, room=room)
         
         serializer = DecryptInvoiceSerializer(data=request.data)
@@ -153,32 +157,17 @@ def decrypt_invoice_api(request, room_hash):
             }, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            seller_data = InvoiceEncryption.decrypt_data(
-                encrypted_record.encrypted_seller_data,
-                user_room_hash
-            )
-            buyer_data = InvoiceEncryption.decrypt_data(
-                encrypted_record.encrypted_buyer_data,
-                user_room_hash
-            )
-            invoice_data = InvoiceEncryption.decrypt_data(
-                encrypted_record.encrypted_invoice_data,
-                user_room_hash
-            )
-            items_data = InvoiceEncryption.decrypt_data(
-                encrypted_record.encrypted_items_data,
-                user_room_hash
-            )
+            decrypted = InvoiceEncryption.decrypt_record(encrypted_record, user_room_hash)
             
-            encrypted_record.increment_verification()
+            verification_counter.record(encrypted_record)
             
             return Response({
                 'success': True,
                 'message': 'Invoice decrypted successfully',
-                'seller': seller_data,
-                'buyer': buyer_data,
-                'invoice': invoice_data,
-                'items': items_data,
+                'seller': decrypted['seller'],
+                'buyer': decrypted['buyer'],
+                'invoice': decrypted['invoice'],
+                'items': decrypted['items'],
                 'metadata': {
                     'finalized_at': encrypted_record.finalized_at.isoformat(),
                     'verification_count': encrypted_record.verification_count,
@@ -209,15 +198,16 @@ def decrypt_invoice_api(request, room_hash):
 @require_http_methods(["GET"])
 def encrypted_invoice_status(request, room_hash):
     try:
-        room = get_object_or_404(Room, room_hash=room_hash)
+        room = get_object_or_404(Room.objects.with_parties(), room_hash=room_hash)
         
         if hasattr(room, 'encrypted_invoice'):
             encrypted_record = room.encrypted_invoice
+            verification_count, _ = verification_counter.current(encrypted_record)
             return JsonResponse({
                 'exists': True,
                 'encrypted_invoice_id': str(encrypted_record.id),
                 'finalized_at': encrypted_record.finalized_at.isoformat(),
-                'verification_count': encrypted_record.verification_count,
+                'verification_count': verification_count,
                 'is_active': encrypted_record.is_active,
             })
         else:
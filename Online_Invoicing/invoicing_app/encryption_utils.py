@@ -1,18 +1,102 @@
 import json
+import hmac
 import hashlib
 import secrets
+import threading
+import time
 from base64 import b64encode, b64decode
+from collections import OrderedDict
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.backends import default_backend
+from django.conf import settings
+
+
+class DerivedKeyCache:
+    """Bounded, TTL-evicting LRU of derived Fernet keys.
+
+    Entries are keyed by an HMAC of (room_hash, salt) under a per-process
+    secret, so raw room hashes are never held as cache keys.
+    """
+
+    def __init__(self, max_size: int = 256, ttl: float = 300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._secret = secrets.token_bytes(32)
+
+    def _digest(self, room_hash: str, salt: bytes) -> bytes:
+        return hmac.new(self._secret, salt + b":" + room_hash.encode(), hashlib.sha256).digest()
+
+    def get(self, room_hash: str, salt: bytes):
+        digest = self._digest(room_hash, salt)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[digest]
+            self.misses += 1
+            return None
+
+    def set(self, room_hash: str, salt: bytes, key: bytes):
+        if self.max_size <= 0:
+            return
+        digest = self._digest(room_hash, salt)
+        with self._lock:
+            self._entries[digest] = (key, time.monotonic() + self.ttl)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
+
+
+_key_cache = None
+
+
+def get_key_cache() -> DerivedKeyCache:
+    global _key_cache
+    if _key_cache is None:
+        _key_cache = DerivedKeyCache(
+            max_size=getattr(settings, 'INVOICE_KEY_CACHE_SIZE', 256),
+            ttl=getattr(settings, 'INVOICE_KEY_CACHE_TTL', 300),
+        )
+    return _key_cache
 
 
 class InvoiceEncryption:   
     @staticmethod
     def _derive_key(room_hash: str, salt: bytes = None) -> tuple:
+        cache = get_key_cache()
         if salt is None:
             salt = secrets.token_bytes(16)
+        else:
+            key = cache.get(room_hash, salt)
+            if key is not None:
+                return key, salt
         
         kdf = PBKDF2HMAC(
             algorithm=hashes.SHA256(),
@@ -22,21 +106,29 @@ class InvoiceEncryption:
             backend=default_backend()
         )
         key = b64encode(kdf.derive(room_hash.encode()))
+        cache.set(room_hash, salt, key)
         return key, salt
     
+    @staticmethod
+    def _encrypt_with(cipher: Fernet, salt: bytes, data: dict) -> str:
+        json_data = json.dumps(data, default=str)
+        encrypted = cipher.encrypt(json_data.encode())
+        combined = salt + encrypted
+        return b64encode(combined).decode('utf-8')
+
+    @staticmethod
+    def _split(encrypted_string: str) -> tuple:
+        combined = b64decode(encrypted_string.encode('utf-8'))
+        return combined[:16], combined[16:]
+
     @staticmethod
     def encrypt_data(data: dict, room_hash: str) -> str:
         try:
-            json_data = json.dumps(data, default=str)
-            
             key, salt = InvoiceEncryption._derive_key(room_hash)
             
             cipher = Fernet(key)
             
-            encrypted = cipher.encrypt(json_data.encode())
-            
-            combined = salt + encrypted
-            return b64encode(combined).decode('utf-8')
+            return InvoiceEncryption._encrypt_with(cipher, salt, data)
         
         except Exception as e:
             raise ValueError(f"Encryption failed: {str(e)}")
@@ -44,10 +136,7 @@ class InvoiceEncryption:
     @staticmethod
     def decrypt_data(encrypted_string: str, room_hash: str) -> dict:
         try:
-            combined = b64decode(encrypted_string.encode('utf-8'))
-            
-            salt = combined[:16]
-            encrypted = combined[16:]
+            salt, encrypted = InvoiceEncryption._split(encrypted_string)
             
             key, _ = InvoiceEncryption._derive_key(room_hash, salt)
             
@@ -59,6 +148,60 @@ class InvoiceEncryption:
         
         except Exception as e:
             raise ValueError(f"Decryption failed: Invalid room hash or corrupted data")
+
+    @staticmethod
+    def encrypt_sections(sections: dict, room_hash: str) -> dict:
+        """Encrypt every section under one derived key (record format v2).
+
+        Each ciphertext keeps the ``salt + token`` layout of ``encrypt_data``,
+        all sharing the same salt, so the key is derived once per record.
+        """
+        try:
+            key, salt = InvoiceEncryption._derive_key(room_hash)
+            cipher = Fernet(key)
+            return {
+                name: InvoiceEncryption._encrypt_with(cipher, salt, data)
+                for name, data in sections.items()
+            }
+        
+        except Exception as e:
+            raise ValueError(f"Encryption failed: {str(e)}")
+
+    @staticmethod
+    def decrypt_sections(encrypted_sections: dict, room_hash: str) -> dict:
+        """Decrypt sections written by ``encrypt_sections`` with a single key derivation"""
+        try:
+            split = {name: InvoiceEncryption._split(value) for name, value in encrypted_sections.items()}
+            salts = {salt for salt, _ in split.values()}
+            if len(salts) != 1:
+                raise ValueError("Sections do not share a salt")
+
+            key, _ = InvoiceEncryption._derive_key(room_hash, salts.pop())
+            cipher = Fernet(key)
+            return {
+                name: json.loads(cipher.decrypt(encrypted).decode('utf-8'))
+                for name, (_, encrypted) in split.items()
+            }
+        
+        except Exception as e:
+            raise ValueError(f"Decryption failed: Invalid room hash or corrupted data")
+
+    @staticmethod
+    def decrypt_record(record, room_hash: str) -> dict:
+        """Decrypt the four sections of an EncryptedInvoiceRecord of any format version"""
+        sections = {
+            'seller': record.encrypted_seller_data,
+            'buyer': record.encrypted_buyer_data,
+            'invoice': record.encrypted_invoice_data,
+            'items': record.encrypted_items_data,
+        }
+        if record.format_version >= record.FORMAT_V2:
+            return InvoiceEncryption.decrypt_sections(sections, room_hash)
+        # v1 records salted every section separately
+        return {
+            name: InvoiceEncryption.decrypt_data(value, room_hash)
+            for name, value in sections.items()
+        }
     
     @staticmethod
     def generate_signature(room_hash: str, data_hash: str) -> str:
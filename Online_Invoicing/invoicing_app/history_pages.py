@@ -0,0 +1,59 @@
+"""
+Keyset pagination over a room's negotiation history.
+
+Pages are ordered newest first on ``(created_at, id)``. The cursor encodes
+the last entry of a page, so fetching older entries is an index range scan
+that costs the same however deep the client has scrolled.
+"""
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.encoding import force_str
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(entry):
+    return urlsafe_base64_encode(f"{entry.created_at.isoformat()}|{entry.pk}".encode())
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, pk = force_str(urlsafe_base64_decode(cursor)).split("|")
+        created_at = parse_datetime(created_at)
+        pk = int(pk)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise InvalidCursor(cursor)
+    if created_at is None:
+        raise InvalidCursor(cursor)
+    return created_at, pk
+
+
+def page_size(raw):
+    """Requested page size, falling back to the default and capped at the maximum"""
+    default = getattr(settings, "HISTORY_PAGE_SIZE", 20)
+    maximum = getattr(settings, "HISTORY_PAGE_MAX_SIZE", 100)
+    try:
+        size = int(raw) if raw else default
+    except ValueError:
+        size = default
+    return max(1, min(size, maximum))
+
+
+def history_page(queryset, cursor=None, size=20):
+    """Return ``(entries, next_cursor)`` for the entries older than ``cursor``.
+
+    ``next_cursor`` is None once the oldest entry has been returned.
+    """
+    if cursor:
+        created_at, pk = decode_cursor(cursor)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+
+    entries = list(queryset.order_by("-created_at", "-id")[:size + 1])
+    if len(entries) > size:
+        entries = entries[:size]
+        return entries, encode_cursor(entries[-1])
+    return entries, None
@@ -0,0 +1,170 @@
+"""
+Write paths shared by the invoice views and serializers.
+"""
+from django.db import transaction
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from . import state_machine
+from .models import Room, Seller, Invoice, InvoiceItem, NegotiationHistory, MultiItemNegotiationHistory
+
+ITEM_FIELDS = ['product_name', 'description', 'quantity', 'unit_price']
+NEW_ITEM_REQUIRED_FIELDS = ['product_name', 'quantity', 'unit_price']
+
+
+def expected_version(data):
+    """Invoice version the client last saw, or None when it did not send one"""
+    raw = data.get('version')
+    if raw in (None, ''):
+        return None
+    try:
+        return int(raw)
+    except (TypeError, ValueError):
+        raise ValidationError({'version': ['Invalid integer value']})
+
+
+def run_transition(invoice, name, notes=None, expected_version=None, changes=None):
+    """Apply a state machine transition; returns the error response, or None on success"""
+    try:
+        state_machine.apply(invoice, name, notes=notes, expected_version=expected_version, changes=changes)
+    except state_machine.InvalidTransition as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    except state_machine.TransitionConflict:
+        return Response(
+            {'error': 'The invoice was changed by another request. Reload it and try again.'},
+            status=status.HTTP_409_CONFLICT
+        )
+    return None
+
+
+def apply_seller_edit(invoice, fields, items_data=None, expected_version=None, notes=None):
+    """Write a seller edit of ``fields`` (and items) through the guarded 'edit' transition.
+
+    The edited columns, the status reset and the version bump are one
+    conditional UPDATE, so a stale or concurrent edit changes nothing.
+    Returns the error response, or None on success.
+    """
+    changes = dict(fields)
+    if 'quantity' in changes or 'unit_price' in changes:
+        changes['line_total'] = (
+            changes.get('quantity', invoice.quantity) * changes.get('unit_price', invoice.unit_price)
+        )
+
+    with transaction.atomic():
+        error = run_transition(invoice, 'edit', notes=notes, expected_version=expected_version, changes=changes)
+        if error:
+            return error
+        if items_data is not None:
+            reconcile_invoice_items(invoice, items_data)
+    return None
+
+
+def create_room_with_invoice(seller_data, invoice_data, raw_secret_key=None, items=None):
+    """Create a room with its seller, invoice, items and first history entry.
+
+    Everything is written in one transaction with a single INSERT per table.
+    The returned room has its seller, invoice and history caches filled, so
+    serializing it reads back nothing but the (absent) buyer.
+    """
+    room = Room()
+    seller = Seller(room=room, **seller_data)
+    if raw_secret_key:
+        seller.set_secret_key(raw_secret_key)
+    invoice = Invoice(room=room, **invoice_data)
+    history = NegotiationHistory(room=room, action='created', actor='seller', notes='Invoice created')
+
+    with transaction.atomic():
+        room.save()
+        seller.save()
+        invoice.save()
+        if items:
+            for item in items:
+                item.invoice = invoice
+            InvoiceItem.objects.bulk_create(items)
+        history.save()
+
+    # A new room has exactly one history entry
+    room.recent_history = [history]
+    return room
+
+
+def _describe(item):
+    return f"{item.product_name} ({item.quantity} x {item.unit_price})"
+
+
+def reconcile_invoice_items(invoice, items_data, actor='seller'):
+    """Make ``invoice.items`` match ``items_data``, touching only the rows that differ.
+
+    Entries whose ``id`` belongs to the invoice update that row, entries
+    without a known ``id`` are inserted, and rows missing from
+    ``items_data`` are deleted. Every change is recorded as an
+    ``added_item``/``edited_item``/``removed_item`` history entry. New
+    entries missing a required field raise ValidationError before anything
+    is written.
+    """
+    existing = {item.id: item for item in invoice.items.all()}
+    kept = set()
+    to_update, to_create = [], []
+    edit_notes = {}
+    errors = {}
+
+    for index, data in enumerate(items_data):
+        item = existing.get(data.get('id'))
+        if item is None or item.id in kept:
+            missing = [field for field in NEW_ITEM_REQUIRED_FIELDS if data.get(field) in (None, '')]
+            if missing:
+                errors[index] = {field: ['This field is required for new items.'] for field in missing}
+                continue
+            new_item = InvoiceItem(invoice=invoice, **{field: data.get(field) for field in ITEM_FIELDS})
+            new_item.line_total = new_item.quantity * new_item.unit_price
+            to_create.append(new_item)
+            continue
+
+        kept.add(item.id)
+        changes = []
+        for field in ITEM_FIELDS:
+            if field in data and getattr(item, field) != data[field]:
+                changes.append(f"{field}: {getattr(item, field)} -> {data[field]}")
+                setattr(item, field, data[field])
+        if changes:
+            item.line_total = item.quantity * item.unit_price
+            to_update.append(item)
+            edit_notes[item.id] = f"Edited {item.product_name}: " + ", ".join(changes)
+
+    if errors:
+        raise ValidationError({'items': errors})
+
+    removed = [item for item_id, item in existing.items() if item_id not in kept]
+
+    with transaction.atomic():
+        if to_update:
+            InvoiceItem.objects.bulk_update(to_update, ITEM_FIELDS + ['line_total'])
+        if to_create:
+            InvoiceItem.objects.bulk_create(to_create)
+        if removed:
+            InvoiceItem.objects.filter(id__in=[item.id for item in removed]).delete()
+
+        history = [
+            MultiItemNegotiationHistory(
+                room_id=invoice.room_id, invoice=invoice, item=item,
+                action='edited_item', actor=actor, notes=edit_notes[item.id],
+            )
+            for item in to_update
+        ] + [
+            MultiItemNegotiationHistory(
+                room_id=invoice.room_id, invoice=invoice, item=item if item.pk else None,
+                action='added_item', actor=actor, notes=f"Added {_describe(item)}",
+            )
+            for item in to_create
+        ] + [
+            MultiItemNegotiationHistory(
+                room_id=invoice.room_id, invoice=invoice, item=None,
+                action='removed_item', actor=actor, notes=f"Removed {_describe(item)}",
+            )
+            for item in removed
+        ]
+        if history:
+            MultiItemNegotiationHistory.objects.bulk_create(history)
+
+    return {'added': to_create, 'edited': to_update, 'removed': removed}
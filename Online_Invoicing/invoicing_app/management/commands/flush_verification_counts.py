@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from invoicing_app import verification_counter
+
+
+class Command(BaseCommand):
+    help = "Write pending encrypted-invoice verification counts to the database"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of records whose pending counts are read per cache round trip",
+        )
+
+    def handle(self, *args, **options):
+        flushed = verification_counter.flush_all(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Flushed verification counts for {flushed} record(s)"))
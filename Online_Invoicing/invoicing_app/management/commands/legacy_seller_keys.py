@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from invoicing_app.models import Seller
+
+
+class Command(BaseCommand):
+    help = "Report sellers whose secret key has no lookup fingerprint yet"
+
+    def handle(self, *args, **options):
+        remaining = Seller.objects.legacy_keys().count()
+        scanning = getattr(settings, "SELLER_LEGACY_KEY_SCAN", True)
+        self.stdout.write(f"{remaining} seller(s) without a secret key fingerprint")
+        if remaining and not scanning:
+            self.stdout.write(self.style.WARNING(
+                "SELLER_LEGACY_KEY_SCAN is off: these sellers cannot log in until it is enabled"
+            ))
+        elif not remaining and scanning:
+            self.stdout.write(self.style.SUCCESS("All sellers are fingerprinted; SELLER_LEGACY_KEY_SCAN can be turned off"))
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from invoicing_app.models import Room
+from invoicing_app.reports.prerender import render_many
+from invoicing_app.reports.proof_transactions import base_url_for
+
+
+class Command(BaseCommand):
+    help = "Pre-render proof-of-transaction PDFs for every finalized room missing a cached copy"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=getattr(settings, "PROOF_PDF_PRERENDER_WORKERS", 2),
+            help="Number of rooms rendered in parallel",
+        )
+        parser.add_argument(
+            "--base-url",
+            default=base_url_for(None),
+            help="Scheme and host encoded in the verification QR code (default: PROOF_PDF_BASE_URL)",
+        )
+
+    def handle(self, *args, **options):
+        base_url = options["base_url"].rstrip("/")
+        room_hashes = list(
+            Room.objects.filter(invoice__status="finalized").values_list("room_hash", flat=True)
+        )
+
+        results = [
+            cached.rendered
+            for _, cached in render_many(room_hashes, base_url, options["concurrency"])
+        ]
+
+        rendered = sum(results)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rendered {rendered} proof PDF(s), {len(results) - rendered} already cached"
+        ))
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:37
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoicing_app', '0007_multiitemnegotiationhistory'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EncryptedInvoiceRecord',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('encrypted_seller_data', models.TextField()),
+                ('encrypted_buyer_data', models.TextField()),
+                ('encrypted_invoice_data', models.TextField()),
+                ('encrypted_items_data', models.TextField()),
+                ('data_hash', models.CharField(max_length=64)),
+                ('verification_signature', models.CharField(max_length=128)),
+                ('finalized_at', models.DateTimeField(auto_now_add=True)),
+                ('last_verified_at', models.DateTimeField(blank=True, null=True)),
+                ('verification_count', models.IntegerField(default=0)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('room', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='encrypted_invoice', to='invoicing_app.room')),
+            ],
+            options={
+                'verbose_name': 'Encrypted Invoice Record',
+                'verbose_name_plural': 'Encrypted Invoice Records',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
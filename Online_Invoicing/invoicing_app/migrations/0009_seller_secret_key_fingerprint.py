@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoicing_app', '0008_encryptedinvoicerecord'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='seller',
+            name='secret_key_fingerprint',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoicing_app', '0009_seller_secret_key_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='encryptedinvoicerecord',
+            name='format_version',
+            field=models.PositiveSmallIntegerField(choices=[(1, 'Per-section keys'), (2, 'Single record key')], default=1),
+        ),
+    ]
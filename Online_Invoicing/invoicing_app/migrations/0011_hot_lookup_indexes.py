@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 06:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoicing_app', '0010_encryptedinvoicerecord_format_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='encryptedinvoicerecord',
+            index=models.Index(fields=['-created_at'], name='encrypted_record_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['status', 'seller_confirmed_at'], name='invoice_status_confirmed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='multiitemnegotiationhistory',
+            index=models.Index(fields=['room', '-created_at'], name='multi_history_room_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='negotiationhistory',
+            index=models.Index(fields=['room', '-created_at'], name='history_room_created_idx'),
+        ),
+    ]
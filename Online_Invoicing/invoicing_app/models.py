@@ -8,7 +8,9 @@ from django.contrib.auth.hashers import make_password, check_password
 import secrets
 
 from django.contrib.auth.hashers import make_password, check_password
+from django.conf import settings
 from django.db import models
+from django.utils.crypto import salted_hmac
 
 def generate_room_hash():
     unique_string = f"{uuid.uuid4()}{secrets.token_hex(16)}{timezone.now().isoformat()}"
@@ -21,6 +23,39 @@ def generate_buyer_room_hash():
 def generate_verification_key():
     return secrets.token_urlsafe(32)
 
+def secret_key_fingerprint(raw_key: str) -> str:
+    """Keyed, non-reversible lookup value for a raw seller secret key"""
+    return salted_hmac("invoicing_app.Seller.secret_key", raw_key, algorithm="sha256").hexdigest()
+
+ROOM_DETAIL_RELATED = ("seller", "buyer", "invoice")
+
+def history_embed_limit():
+    """Number of history entries embedded in room payloads and proof pages"""
+    return getattr(settings, "ROOM_HISTORY_EMBED_LIMIT", 20)
+
+def room_detail_prefetch():
+    recent = NegotiationHistory.objects.order_by("-created_at", "-id")[:history_embed_limit()]
+    return (models.Prefetch("history", queryset=recent, to_attr="recent_history"), "invoice__items")
+
+class RoomQuerySet(models.QuerySet):
+    def with_parties(self):
+        """Join seller, buyer and invoice into the room query"""
+        return self.select_related(*ROOM_DETAIL_RELATED)
+
+    def with_details(self):
+        """Load everything RoomDetailSerializer reads in a fixed number of queries"""
+        return self.with_parties().prefetch_related(*room_detail_prefetch())
+
+    def with_latest_history(self):
+        latest = NegotiationHistory.objects.filter(room=models.OuterRef("pk")).order_by("-id").values("id")[:1]
+        return self.annotate(latest_history_id=models.Subquery(latest))
+
+    def state_markers(self):
+        """Timestamps and ids that change whenever the serialized room does, in one query"""
+        return self.with_latest_history().values(
+            "updated_at", "latest_history_id", invoice_updated_at=models.F("invoice__updated_at"),
+        )
+
 class Room(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     room_hash = models.CharField(max_length=16, unique=True, editable=False)
@@ -30,6 +65,8 @@ class Room(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = RoomQuerySet.as_manager()
+
     def save(self, *args, **kwargs):
         if not self.room_hash:
             self.room_hash = generate_room_hash()
@@ -37,9 +74,19 @@ class Room(models.Model):
             self.verification_key = generate_verification_key()
         super().save(*args, **kwargs)
 
+    def load_details(self):
+        """Prefetch history and items after writes made through this instance"""
+        models.prefetch_related_objects([self], *room_detail_prefetch())
+        return self
+
     def __str__(self):
         return f"Room {self.room_hash}"
 
+class SellerQuerySet(models.QuerySet):
+    def legacy_keys(self):
+        """Sellers with a secret key but no fingerprint"""
+        return self.filter(secret_key_fingerprint__isnull=True).exclude(secret_key__isnull=True)
+
 class Seller(models.Model):
     room = models.OneToOneField(Room, on_delete=models.CASCADE, related_name="seller")
     fullname = models.CharField(max_length=255)
@@ -51,19 +98,46 @@ class Seller(models.Model):
 
     # Hashed secret key
     secret_key = models.CharField(max_length=255, null=True, blank=True)
+    # HMAC of the raw key, used to find the candidate seller without hashing against every row
+    secret_key_fingerprint = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+
+    objects = SellerQuerySet.as_manager()
 
     def set_secret_key(self, raw_key: str):
         hashed = make_password(raw_key)
         self.secret_key = hashed
+        self.secret_key_fingerprint = secret_key_fingerprint(raw_key)
         if self.room_id:
             self.room.seller_hash = hashed
-            self.room.save(update_fields=["seller_hash"])
+            # A room that is not stored yet picks the hash up on its first save
+            if not self.room._state.adding:
+                self.room.save(update_fields=["seller_hash"])
 
     def check_secret_key(self, raw_key: str) -> bool:
         if not self.secret_key:
             return False
         return check_password(raw_key, self.secret_key)
 
+    @classmethod
+    def authenticate(cls, raw_key: str):
+        """Return the seller owning ``raw_key`` or None"""
+        fingerprint = secret_key_fingerprint(raw_key)
+        for seller in cls.objects.filter(secret_key_fingerprint=fingerprint):
+            if seller.check_secret_key(raw_key):
+                return seller
+
+        # Rows created before fingerprints existed cannot be backfilled offline, since the
+        # fingerprint needs the raw key. They are tried in turn and fingerprinted on their
+        # next successful login, until SELLER_LEGACY_KEY_SCAN is turned off.
+        if not getattr(settings, "SELLER_LEGACY_KEY_SCAN", True):
+            return None
+        for seller in cls.objects.legacy_keys():
+            if seller.check_secret_key(raw_key):
+                seller.secret_key_fingerprint = fingerprint
+                seller.save(update_fields=["secret_key_fingerprint"])
+                return seller
+        return None
+
     def __str__(self):
         return f"Seller: {self.fullname}"
 
@@ -114,10 +188,44 @@ class Invoice(models.Model):
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Incremented by every edit and status change; clients echo it back to detect stale writes
+    version = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'seller_confirmed_at'], name='invoice_status_confirmed_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         self.line_total = self.quantity * self.unit_price
         super().save(*args, **kwargs)
+
+    def transition(self, sources, target, stamp=None, changes=None):
+        """Move to ``target`` in one conditional UPDATE.
+
+        The row must still have the version this instance was read with and
+        one of the ``sources`` statuses. ``changes`` are further column values
+        written by the same UPDATE, so edits share its guard. Returns False
+        when another request changed the invoice first. Views go through
+        state_machine.apply().
+        """
+        now = timezone.now()
+        values = {**(changes or {}), "status": target, "version": models.F("version") + 1, "updated_at": now}
+        if stamp:
+            values[stamp] = now
+
+        rows = Invoice.objects.filter(pk=self.pk, version=self.version, status__in=sources)
+        if not rows.update(**values):
+            return False
+
+        for field, value in (changes or {}).items():
+            setattr(self, field, value)
+        self.status = target
+        self.version += 1
+        self.updated_at = now
+        if stamp:
+            setattr(self, stamp, now)
+        return True
         
     def total_amount(self): 
         return sum(item.line_total for item in self.items.all())
@@ -158,6 +266,9 @@ class NegotiationHistory(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['room', '-created_at'], name='history_room_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.actor} - {self.action} at {self.created_at}"
@@ -186,6 +297,9 @@ class MultiItemNegotiationHistory(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['room', '-created_at'], name='multi_history_room_created_idx'),
+        ]
 
     def __str__(self):
         if self.item:
@@ -195,6 +309,13 @@ class MultiItemNegotiationHistory(models.Model):
         return f"{self.actor} - {self.action} at {self.created_at}"
 
 class EncryptedInvoiceRecord(models.Model):
+    FORMAT_V1 = 1  # one key derivation per section
+    FORMAT_V2 = 2  # one key derivation per record
+    FORMAT_CHOICES = [
+        (FORMAT_V1, 'Per-section keys'),
+        (FORMAT_V2, 'Single record key'),
+    ]
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     room = models.OneToOneField(Room, on_delete=models.CASCADE, related_name="encrypted_invoice")
     
@@ -202,6 +323,7 @@ class EncryptedInvoiceRecord(models.Model):
     encrypted_buyer_data = models.TextField()
     encrypted_invoice_data = models.TextField()
     encrypted_items_data = models.TextField()
+    format_version = models.PositiveSmallIntegerField(choices=FORMAT_CHOICES, default=FORMAT_V1)
     
     data_hash = models.CharField(max_length=64) 
     verification_signature = models.CharField(max_length=128)
@@ -217,6 +339,9 @@ class EncryptedInvoiceRecord(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['-created_at'], name='encrypted_record_created_idx'),
+        ]
         verbose_name = "Encrypted Invoice Record"
         verbose_name_plural = "Encrypted Invoice Records"
 
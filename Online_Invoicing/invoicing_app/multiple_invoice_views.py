@@ -1,3 +1,6 @@
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
 from django.shortcuts import render, redirect
 from django.utils import timezone
 from .models import Room, Seller, Invoice, InvoiceItem
@@ -8,91 +11,109 @@ from rest_framework import status
 from django.shortcuts import get_object_or_404
 from .models import Room, InvoiceItem, NegotiationHistory
 from .serializers import InvoiceSerializer, RoomDetailSerializer
+from .invoice_services import apply_seller_edit, create_room_with_invoice, expected_version
+from . import room_cache
+from .realtime import publish_room_state
+from .capabilities import grant_seller_room, seller_token_required
 
 @api_view(['PUT'])
+@seller_token_required
 def seller_update_invoice(request, room_hash):
-    room = get_object_or_404(Room, room_hash=room_hash)
+    room = get_object_or_404(Room.objects.with_parties(), room_hash=room_hash)
     invoice = room.invoice
 
     serializer = InvoiceSerializer(invoice, data=request.data, partial=True)
     if serializer.is_valid():
-        invoice = serializer.save()
-
-        items_data = request.data.get('items')
-        if items_data and isinstance(items_data, list):
-            invoice.items.all().delete()
-            for item in items_data:
-                InvoiceItem.objects.create(
-                    invoice=invoice,
-                    product_name=item.get('product_name'),
-                    description=item.get('description'),
-                    quantity=item.get('quantity'),
-                    unit_price=item.get('unit_price'),
-                    line_total=float(item.get('quantity')) * float(item.get('unit_price'))
-                )
-
-        invoice.status = 'draft'
-        invoice.save(update_fields=['status'])
-
-        NegotiationHistory.objects.create(
-            room=room,
-            action='edited',
-            actor='seller',
-            notes='Invoice edited by seller'
+        fields = dict(serializer.validated_data)
+        error = apply_seller_edit(
+            invoice, fields, items_data=fields.pop('items', None), expected_version=expected_version(request.data)
         )
+        if error:
+            return error
 
-        room_serializer = RoomDetailSerializer(room, context={'request': request})
+        room_serializer = RoomDetailSerializer(room.load_details(), context={'request': request})
+        room_cache.bump(room.room_hash)
+        publish_room_state(room.room_hash, 'edited', room_serializer.data)
         return Response(room_serializer.data)
 
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+def _parse_item_rows(post):
+    """Validate the ``items-{i}-*`` rows of the create form before anything is written"""
+    max_items = getattr(settings, 'MAX_INVOICE_ITEMS', 200)
+    try:
+        items_count = int(post.get("items-count", 0))
+    except (TypeError, ValueError):
+        return [], ["Invalid item count."]
+    if items_count > max_items:
+        return [], [f"An invoice can have at most {max_items} items."]
+
+    items, errors = [], []
+    for i in range(items_count):
+        product_name = post.get(f"items-{i}-product_name")
+        description = post.get(f"items-{i}-description")
+        quantity = post.get(f"items-{i}-quantity")
+        unit_price = post.get(f"items-{i}-unit_price")
+
+        # Rows removed in the browser leave gaps in the numbering
+        if not (product_name or quantity or unit_price):
+            continue
+
+        try:
+            quantity = int(quantity)
+            unit_price = Decimal(unit_price)
+            # NaN survives quantize() and only fails later, in the comparisons below
+            if not unit_price.is_finite():
+                raise ValueError(unit_price)
+            unit_price = unit_price.quantize(Decimal("0.01"))
+        except (TypeError, ValueError, InvalidOperation):
+            errors.append(f"Item {i + 1}: quantity and unit price must be numbers.")
+            continue
+        if not product_name or quantity < 1 or unit_price < 0:
+            errors.append(f"Item {i + 1}: product name, a positive quantity and a unit price are required.")
+            continue
+
+        items.append(InvoiceItem(
+            product_name=product_name,
+            description=description,
+            quantity=quantity,
+            unit_price=unit_price,
+            line_total=quantity * unit_price,
+        ))
+
+    if not items and not errors:
+        errors.append("You must add at least one invoice item.")
+    return items, errors
+
 def create_multiple_invoice(request):
     if request.method == "POST":
-        room = Room.objects.create()
-
-        seller = Seller.objects.create(
-            room=room,
-            fullname=request.POST.get("seller_fullname"),
-            email=request.POST.get("seller_email"),
-            phone=request.POST.get("seller_phone"),
-            social_media=request.POST.get("seller_social_media"),
-            profile_picture=request.FILES.get("seller_profile_picture"),
-        )
-        
-        raw_secret = request.POST.get("seller_secret_key")
-        if raw_secret:
-            seller.set_secret_key(raw_secret)
-            seller.save()
-            
-        invoice = Invoice.objects.create(
-            room=room,
-            invoice_date=request.POST.get("invoice_date") or timezone.now().date(),
-            due_date=request.POST.get("due_date") or None,
-            payment_method=request.POST.get("payment_method"),
-            status=request.POST.get("status") or "draft",
-            description="Multi-item invoice",
-            quantity=0,
-            unit_price=0,
-            line_total=0,
-        )
+        items, errors = _parse_item_rows(request.POST)
+        if errors:
+            return render(request, "seller_create_multiple_invoice_page.html", {"errors": errors}, status=400)
 
-        items_count = int(request.POST.get("items-count", 0))
-        for i in range(items_count):
-            product_name = request.POST.get(f"items-{i}-product_name")
-            description = request.POST.get(f"items-{i}-description")
-            quantity = request.POST.get(f"items-{i}-quantity")
-            unit_price = request.POST.get(f"items-{i}-unit_price")
-
-            if product_name and quantity and unit_price:
-                InvoiceItem.objects.create(
-                    invoice=invoice,
-                    product_name=product_name,
-                    description=description,
-                    quantity=int(quantity),
-                    unit_price=float(unit_price),
-                )
+        room = create_room_with_invoice(
+            seller_data={
+                'fullname': request.POST.get("seller_fullname"),
+                'email': request.POST.get("seller_email"),
+                'phone': request.POST.get("seller_phone"),
+                'social_media': request.POST.get("seller_social_media"),
+                'profile_picture': request.FILES.get("seller_profile_picture"),
+            },
+            raw_secret_key=request.POST.get("seller_secret_key"),
+            invoice_data={
+                'invoice_date': request.POST.get("invoice_date") or timezone.now().date(),
+                'due_date': request.POST.get("due_date") or None,
+                'payment_method': request.POST.get("payment_method"),
+                'status': request.POST.get("status") or "draft",
+                'description': "Multi-item invoice",
+                'quantity': 0,
+                'unit_price': 0,
+                'line_total': 0,
+            },
+            items=items,
+        )
 
+        grant_seller_room(request, room.room_hash)
         return redirect("seller_room", room_hash=room.room_hash)
 
     return render(request, "seller_create_multiple_invoice_page.html")
-  
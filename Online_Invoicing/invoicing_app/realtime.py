@@ -0,0 +1,43 @@
+"""
+Server-side push of room state to NegotiationConsumer groups.
+
+State-changing views publish the freshly serialized room after their
+transaction commits, so both parties update from the server's copy instead
+of relaying client messages and refetching ``/api/room/<hash>/``.
+"""
+import json
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+def room_group_name(room_hash):
+    return f'negotiation_{room_hash}'
+
+
+def _send(room_hash, text):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(
+            room_group_name(room_hash),
+            {'type': 'room.push', 'text': text}
+        )
+    except Exception:
+        logger.exception("Publishing room state failed for room %s", room_hash)
+
+
+def publish_room_state(room_hash, event, data):
+    """Push ``{"type": event, "data": data}`` to the room group on commit.
+
+    The message is rendered to JSON once here and sent verbatim to every
+    socket in the group.
+    """
+    text = json.dumps({'type': event, 'data': data}, cls=DjangoJSONEncoder)
+    transaction.on_commit(lambda: _send(room_hash, text))
@@ -0,0 +1,40 @@
+"""
+Streaming ZIP export of many proof-of-transaction PDFs.
+
+PDFs come from ``pdf_cache`` (rendered in parallel on a miss) and are
+written into a ZIP that is handed to the client chunk by chunk, so only the
+entry being copied is ever held in memory.
+"""
+import shutil
+import zipfile
+
+from .prerender import render_many
+
+
+class _ZipStream:
+    """Write-only, non-seekable sink that collects zipfile output for a generator"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+def stream_proofs_zip(room_hashes, base_url, concurrency=1):
+    """Yield the bytes of a ZIP holding one proof PDF per room"""
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for room_hash, cached in render_many(room_hashes, base_url, concurrency):
+            with archive.open(f"Proof_Transaction_{room_hash}.pdf", "w") as entry, cached.open() as pdf:
+                shutil.copyfileobj(pdf, entry)
+            yield from stream.drain()
+    yield from stream.drain()
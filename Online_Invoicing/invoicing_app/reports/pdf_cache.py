@@ -0,0 +1,102 @@
+"""
+Content-addressed cache of rendered proof-of-transaction PDFs.
+
+A render is stored under ``proofs/<room_hash>/<digest>.pdf`` in the storage
+named by ``PROOF_PDF_STORAGE`` (MEDIA_ROOT by default), where the digest
+covers the serialized room data and the verification base URL. Any change
+to the invoice produces a new digest, so stale renders are never served;
+they are pruned when the room is rendered again or ``invalidate`` is called.
+A render pruned between lookup and ``open()`` raises FileNotFoundError,
+which callers treat as a miss.
+"""
+import hashlib
+import json
+from dataclasses import dataclass
+from datetime import datetime
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+
+from .proof_transactions import build_proof_transaction_pdf
+
+CACHE_DIR = "proofs"
+
+
+@dataclass
+class CachedPdf:
+    name: str
+    digest: str
+    modified_at: datetime
+    rendered: bool = False
+
+    def open(self):
+        return get_storage().open(self.name, "rb")
+
+
+def get_storage():
+    return storages[getattr(settings, "PROOF_PDF_STORAGE", "default")]
+
+
+def room_proof_data(room):
+    """Serialized room data the proof PDF is rendered from"""
+    from ..serializers import RoomDetailSerializer
+
+    data = RoomDetailSerializer(room).data.copy()
+    data["room_id"] = str(room.id)
+    return data
+
+
+def content_digest(data, base_url):
+    payload = json.dumps({"data": data, "base_url": base_url}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _room_dir(room_hash):
+    return f"{CACHE_DIR}/{room_hash}"
+
+
+def lookup(room_hash, digest):
+    storage = get_storage()
+    name = f"{_room_dir(room_hash)}/{digest}.pdf"
+    if not storage.exists(name):
+        return None
+    return CachedPdf(name, digest, storage.get_modified_time(name))
+
+
+def get_or_build(room_hash, data, base_url):
+    """Return the cached render for ``data``, building and storing it on a miss"""
+    digest = content_digest(data, base_url)
+    cached = lookup(room_hash, digest)
+    if cached:
+        return cached
+
+    buffer = BytesIO()
+    build_proof_transaction_pdf(buffer, data, base_url=base_url)
+
+    storage = get_storage()
+    canonical = f"{_room_dir(room_hash)}/{digest}.pdf"
+    name = storage.save(canonical, ContentFile(buffer.getvalue()))
+    if name != canonical:
+        # A concurrent render of the same content got there first; storage gave
+        # this copy another name, so drop it and serve the identical original
+        storage.delete(name)
+        name = canonical
+    # Prune only once the new render is stored, so concurrent readers always find one
+    invalidate(room_hash, keep=digest)
+    return CachedPdf(name, digest, storage.get_modified_time(name), rendered=True)
+
+
+def invalidate(room_hash, keep=None):
+    """Delete every cached render of ``room_hash`` except those of digest ``keep``"""
+    storage = get_storage()
+    directory = _room_dir(room_hash)
+    try:
+        _, files = storage.listdir(directory)
+    except FileNotFoundError:
+        return
+    for filename in files:
+        if keep and filename.startswith(keep):
+            continue
+        storage.delete(f"{directory}/{filename}")
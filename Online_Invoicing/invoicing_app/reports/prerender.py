@@ -0,0 +1,109 @@
+"""
+Background pre-rendering of proof-of-transaction PDFs.
+
+When ``PROOF_PDF_PRERENDER`` is enabled, finalizing an invoice queues its
+proof onto a small thread pool so the first download finds it in
+``pdf_cache``. At most ``PROOF_PDF_PRERENDER_QUEUE`` renders are pending at
+once; anything beyond that is skipped and rendered lazily on download.
+"""
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from . import pdf_cache
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+
+
+def render_room(room_hash, base_url):
+    """Render (or find) the cached proof PDF of one room"""
+    from ..models import Room
+
+    room = Room.objects.with_details().get(room_hash=room_hash)
+    return pdf_cache.get_or_build(room.room_hash, pdf_cache.room_proof_data(room), base_url)
+
+
+def render_many(room_hashes, base_url, concurrency=1):
+    """Yield ``(room_hash, CachedPdf)`` in input order, rendering up to ``concurrency`` at once.
+
+    At most ``concurrency`` renders are submitted ahead of the consumer. If
+    the consumer stops early, queued renders are cancelled and the caller
+    does not wait for those still running.
+    """
+    if concurrency <= 1:
+        for room_hash in room_hashes:
+            yield room_hash, render_room(room_hash, base_url)
+        return
+
+    def render_in_worker(room_hash):
+        try:
+            return render_room(room_hash, base_url)
+        finally:
+            close_old_connections()
+
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="proof-pdf-batch")
+    remaining = iter(room_hashes)
+    window = deque()
+
+    def submit_next():
+        for room_hash in remaining:
+            window.append((room_hash, executor.submit(render_in_worker, room_hash)))
+            return
+
+    try:
+        for _ in range(concurrency):
+            submit_next()
+        while window:
+            room_hash, future = window.popleft()
+            cached = future.result()
+            submit_next()
+            yield room_hash, cached
+    finally:
+        for _, future in window:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def _get_executor():
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "PROOF_PDF_PRERENDER_WORKERS", 2),
+                thread_name_prefix="proof-pdf",
+            )
+            _slots = threading.BoundedSemaphore(getattr(settings, "PROOF_PDF_PRERENDER_QUEUE", 32))
+        return _executor, _slots
+
+
+def _run(room_hash, base_url, slots):
+    try:
+        render_room(room_hash, base_url)
+    except Exception:
+        logger.exception("Pre-rendering proof PDF failed for room %s", room_hash)
+    finally:
+        close_old_connections()
+        slots.release()
+
+
+def _submit(room_hash, base_url):
+    executor, slots = _get_executor()
+    if not slots.acquire(blocking=False):
+        logger.warning("Proof PDF pre-render queue full, skipping room %s", room_hash)
+        return
+    executor.submit(_run, room_hash, base_url, slots)
+
+
+def schedule(room_hash, base_url):
+    """Queue a pre-render once the current transaction commits, if enabled"""
+    if not getattr(settings, "PROOF_PDF_PRERENDER", False):
+        return
+    transaction.on_commit(lambda: _submit(room_hash, base_url))
@@ -1,5 +1,6 @@
 from datetime import datetime
 
+from django.conf import settings
 from reportlab.pdfgen import canvas
 from reportlab.lib import colors
 from reportlab.lib.units import mm
@@ -75,11 +76,22 @@ def qr_code(c, data, x, y, size):
     renderPDF.draw(d, c, x, y)
 
 
-def _qr_block(c, data, y, width, request):
+def base_url_for(request):
+    """Scheme and host encoded in the verification QR code.
+
+    PROOF_PDF_BASE_URL wins over the request host, so downloads, exports and
+    background pre-renders produce the same PDF and share one cache entry.
+    """
+    configured = getattr(settings, "PROOF_PDF_BASE_URL", None)
+    if configured:
+        return configured.rstrip("/")
+    return f"{request.scheme}://{request.get_host()}" if request else "http://localhost:8000"
+
+
+def _qr_block(c, data, y, width, base_url):
     if not data.get("room_id"):
         return y
-    base = f"{request.scheme}://{request.get_host()}" if request else "http://localhost:8000"
-    url = f"{base}/encrypted-invoice/{data['room_id']}/"
+    url = f"{base_url}/encrypted-invoice/{data['room_id']}/"
     sz = 64
     qx = (width - sz) / 2
     c.setFont("Helvetica", 6)
@@ -159,7 +171,7 @@ def _height_multi(data):
     return max(h, 420)
 
 
-def _build_single(c, data, request):
+def _build_single(c, data, base_url):
     width = W
     inv = data.get("invoice", {})
     seller = data.get("seller", {})
@@ -264,12 +276,12 @@ def _build_single(c, data, request):
         y -= 10
 
     y -= 2
-    y = _qr_block(c, data, y, width, request)
+    y = _qr_block(c, data, y, width, base_url)
     y -= 4
     _footer(c, y, width)
 
 
-def _build_multi(c, data, request):
+def _build_multi(c, data, base_url):
     width = W
     inv = data.get("invoice", {})
     items = inv.get("items", [])
@@ -424,12 +436,13 @@ def _build_multi(c, data, request):
         y -= 5
 
     y -= 2
-    y = _qr_block(c, data, y, width, request)
+    y = _qr_block(c, data, y, width, base_url)
     y -= 4
     _footer(c, y, width)
 
 
-def build_proof_transaction_pdf(response, data, request=None, date_created=None):
+def build_proof_transaction_pdf(response, data, request=None, date_created=None, base_url=None):
+    base_url = base_url or base_url_for(request)
     inv = data.get("invoice", {})
     is_multi = bool(inv.get("items"))
 
@@ -441,10 +454,10 @@ def build_proof_transaction_pdf(response, data, request=None, date_created=None)
     c = canvas.Canvas(response, pagesize=(W, page_h))
 
     if is_multi:
-        _build_multi(c, data, request)
+        _build_multi(c, data, base_url)
     else:
-        _build_single(c, data, request)
+        _build_single(c, data, base_url)
 
     c.showPage()
     c.save()
-    return response
\ No newline at end of file
+    return response
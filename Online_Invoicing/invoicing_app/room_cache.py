@@ -0,0 +1,117 @@
+"""
+Cache of serialized room state, shared by every reader of a room.
+
+Entries are keyed by room_hash and a per-room version counter. Write paths
+call ``bump()``, which moves the counter once their transaction commits, so
+readers never see a stale entry and nothing has to be deleted; superseded
+entries simply expire. Counters are only created when a room's state is
+stored, so lookups of unknown rooms leave nothing behind, and they expire
+after VERSION_TIMEOUT_FACTOR state timeouts. A counter lost to expiry or
+eviction restarts from the clock, so an old version number is never reused.
+The backend is the Django cache named by ROOM_STATE_CACHE; with it set to
+None the cache is off, lookups always miss and nothing is stored.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+VERSION_TIMEOUT_FACTOR = 4
+
+_stats_lock = threading.Lock()
+_hits = 0
+_misses = 0
+
+
+def get_cache():
+    """The configured cache, or None when room state caching is off"""
+    alias = getattr(settings, "ROOM_STATE_CACHE", None)
+    return caches[alias] if alias else None
+
+
+def _timeout():
+    return getattr(settings, "ROOM_STATE_CACHE_TIMEOUT", 300)
+
+
+def _version_timeout():
+    return _timeout() * VERSION_TIMEOUT_FACTOR
+
+
+def _version_key(room_hash):
+    return f"room_state:version:{room_hash}"
+
+
+def _state_key(room_hash, version):
+    return f"room_state:{room_hash}:{version}"
+
+
+def _record(hit):
+    global _hits, _misses
+    with _stats_lock:
+        if hit:
+            _hits += 1
+        else:
+            _misses += 1
+
+
+def lookup(room_hash):
+    """Return ``(version, state)``; ``state`` is None on a miss.
+
+    ``version`` is None when the room has no counter yet. Nothing is written.
+    """
+    cache = get_cache()
+    if cache is None:
+        return None, None
+    version = cache.get(_version_key(room_hash))
+    state = None if version is None else cache.get(_state_key(room_hash, version))
+    _record(state is not None)
+    return version, state
+
+
+def store(room_hash, version, state):
+    """Store ``state`` as read at ``version``; a bump in between makes it unreachable.
+
+    Call only for rooms known to exist. With ``version`` None a counter is
+    started, and the state is stored only if no bump created one first.
+    """
+    cache = get_cache()
+    if cache is None:
+        return
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(_version_key(room_hash), version, _version_timeout()):
+            return
+    cache.set(_state_key(room_hash, version), state, _timeout())
+
+
+def _bump_now(room_hash):
+    cache = get_cache()
+    try:
+        cache.incr(_version_key(room_hash))
+    except ValueError:
+        cache.set(_version_key(room_hash), time.time_ns(), _version_timeout())
+
+
+def bump(room_hash):
+    """Invalidate the cached state of a room once the current transaction commits"""
+    if get_cache() is None:
+        return
+    transaction.on_commit(lambda: _bump_now(room_hash))
+
+
+def stats():
+    with _stats_lock:
+        lookups = _hits + _misses
+        return {
+            "hits": _hits,
+            "misses": _misses,
+            "hit_ratio": _hits / lookups if lookups else 0.0,
+        }
+
+
+def reset_stats():
+    global _hits, _misses
+    with _stats_lock:
+        _hits = _misses = 0
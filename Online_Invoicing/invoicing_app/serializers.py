@@ -1,5 +1,9 @@
 from rest_framework import serializers
-from .models import Room, Seller, Buyer, Invoice, NegotiationHistory, InvoiceItem
+from .models import (
+    Room, Seller, Buyer, Invoice, NegotiationHistory, InvoiceItem, MultiItemNegotiationHistory,
+    history_embed_limit,
+)
+from .invoice_services import reconcile_invoice_items
 
 class CreateInvoiceSerializer(serializers.Serializer):
     seller_fullname = serializers.CharField(max_length=255)
@@ -40,7 +44,21 @@ class BuyerJoinSerializer(serializers.Serializer):
     social_media = serializers.CharField(required=False, allow_blank=True)
     profile_picture = serializers.ImageField(required=False, allow_null=True)
 
+class ProofExportSerializer(serializers.Serializer):
+    room_hashes = serializers.ListField(child=serializers.CharField(max_length=16), required=False, allow_empty=False)
+    confirmed_from = serializers.DateField(required=False)
+    confirmed_to = serializers.DateField(required=False)
+
+    def validate(self, data):
+        if not data.get('room_hashes') and not (data.get('confirmed_from') or data.get('confirmed_to')):
+            raise serializers.ValidationError("Provide room_hashes or a confirmed_from/confirmed_to date range.")
+        if data.get('confirmed_from') and data.get('confirmed_to') and data['confirmed_from'] > data['confirmed_to']:
+            raise serializers.ValidationError({"confirmed_to": "End date must not be before start date."})
+        return data
+
 class InvoiceItemSerializer(serializers.ModelSerializer):
+    id = serializers.IntegerField(required=False)
+
     class Meta:
         model = InvoiceItem
         fields = ['id', 'product_name', 'description', 'quantity', 'unit_price', 'line_total']
@@ -59,10 +77,11 @@ class InvoiceSerializer(serializers.ModelSerializer):
             'description',
             'payment_method',
             'status',
+            'version',
             'items',
             'total_amount',
         ]
-        read_only_fields = ['status']
+        read_only_fields = ['status', 'version']
 
     def get_total_amount(self, obj):
         return sum(item.line_total for item in obj.items.all())
@@ -74,9 +93,7 @@ class InvoiceSerializer(serializers.ModelSerializer):
         instance.save()
 
         if items_data is not None:
-            instance.items.all().delete()
-            for item_data in items_data:
-                InvoiceItem.objects.create(invoice=instance, **item_data)
+            reconcile_invoice_items(instance, items_data)
 
         return instance
 
@@ -93,9 +110,10 @@ class SingleInvoiceSerializer(serializers.ModelSerializer):
             'unit_price',
             'payment_method',
             'status',
+            'version',
             'total_amount',
         ]
-        read_only_fields = ['status']
+        read_only_fields = ['status', 'version']
 
     def get_total_amount(self, obj):
         return obj.quantity * obj.unit_price  
@@ -119,15 +137,32 @@ class NegotiationHistorySerializer(serializers.ModelSerializer):
         model = NegotiationHistory
         fields = ['action', 'actor', 'notes', 'created_at']
 
+class MultiItemNegotiationHistorySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = MultiItemNegotiationHistory
+        fields = ['action', 'actor', 'notes', 'item', 'created_at']
+
 class RoomDetailSerializer(serializers.ModelSerializer):
     seller = SellerSerializer(read_only=True)
-    buyer = BuyerSerializer(read_only=True)
-    history = NegotiationHistorySerializer(many=True, read_only=True)
+    buyer = serializers.SerializerMethodField()
+    history = serializers.SerializerMethodField()
 
     class Meta:
         model = Room
         fields = ['room_hash', 'is_buyer_assigned', 'seller', 'buyer', 'invoice', 'history']
 
+    def get_buyer(self, obj):
+        # Rooms have no buyer until one joins
+        buyer = getattr(obj, 'buyer', None)
+        return BuyerSerializer(buyer, context=self.context).data if buyer else None
+
+    def get_history(self, obj):
+        # Filled by Room.objects.with_details() or by the creation service
+        history = getattr(obj, 'recent_history', None)
+        if history is None:
+            history = obj.history.order_by('-created_at', '-id')[:history_embed_limit()]
+        return NegotiationHistorySerializer(history, many=True).data
+
     def to_representation(self, instance):
         data = super().to_representation(instance)
         invoice = instance.invoice
@@ -0,0 +1,82 @@
+"""
+Invoice lifecycle over ``Invoice.STATUS_CHOICES``.
+
+Every status change a view can make is declared in ``TRANSITIONS``: the
+statuses it may start from, the status it moves to, the timestamp it
+stamps and the history entry it records. ``apply()`` runs a transition as
+one guarded UPDATE plus one history INSERT.
+"""
+from dataclasses import dataclass
+from typing import Optional
+
+from django.db import transaction
+
+from .models import NegotiationHistory
+
+# An approved (pending) invoice is no longer editable: the buyer agreed to that version
+EDITABLE_STATUSES = ('draft', 'negotiating', 'rejected')
+
+
+@dataclass(frozen=True)
+class Transition:
+    sources: tuple
+    target: str
+    actor: str
+    action: str
+    notes: str
+    stamp: Optional[str] = None
+
+
+TRANSITIONS = {
+    'start_negotiation': Transition(('draft',), 'negotiating', 'seller', 'edited', 'Negotiation started'),
+    'edit': Transition(EDITABLE_STATUSES, 'draft', 'seller', 'edited', 'Invoice edited by seller'),
+    'approve': Transition(('draft',), 'pending', 'buyer', 'approved', 'Buyer approved the invoice', 'buyer_approved_at'),
+    'disapprove': Transition(('draft',), 'negotiating', 'buyer', 'disapproved', 'Buyer disapproved'),
+    'mark_paid': Transition(('pending',), 'unconfirmed_payment', 'buyer', 'paid', 'Buyer marked as paid', 'buyer_paid_at'),
+    'confirm_payment': Transition(
+        ('unconfirmed_payment',), 'finalized', 'seller', 'confirmed', 'Seller confirmed payment received',
+        'seller_confirmed_at',
+    ),
+}
+
+
+class InvalidTransition(Exception):
+    """The invoice's status does not allow the requested transition"""
+
+    def __init__(self, name, status):
+        super().__init__(f"Cannot {name.replace('_', ' ')} an invoice in {status} status")
+        self.name = name
+        self.status = status
+
+
+class TransitionConflict(Exception):
+    """Another request changed the invoice since it was read"""
+
+
+def allowed(invoice, name):
+    return invoice.status in TRANSITIONS[name].sources
+
+
+def apply(invoice, name, notes=None, expected_version=None, changes=None):
+    """Run transition ``name`` on ``invoice`` and record it in the room history.
+
+    ``changes`` are column values written by the same guarded UPDATE.
+    Raises InvalidTransition if the status read with ``invoice`` does not
+    allow it, and TransitionConflict if the row changed since then or does
+    not have ``expected_version``. Returns the history entry.
+    """
+    spec = TRANSITIONS[name]
+    if invoice.status not in spec.sources:
+        raise InvalidTransition(name, invoice.status)
+    if expected_version is not None and expected_version != invoice.version:
+        raise TransitionConflict()
+
+    with transaction.atomic():
+        if not invoice.transition(spec.sources, spec.target, spec.stamp, changes):
+            raise TransitionConflict()
+        return NegotiationHistory.objects.create(
+            room_id=invoice.room_id,
+            action=spec.action,
+            actor=spec.actor,
+            notes=notes or spec.notes,
+        )
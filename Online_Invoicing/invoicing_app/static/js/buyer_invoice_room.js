@@ -10,16 +10,19 @@ let socket            = null;
 let reconnectAttempts = 0;
 const MAX_RECONNECT   = 5;
 let reconnectTimer    = null;
+let invoiceVersion    = null;
 
 function connectWebSocket() {
   if (socket && socket.readyState === WebSocket.OPEN) return;
 
-  socket = new WebSocket(`${WS_BASE}/ws/room/${roomHash}/`);
+  // The buyer hash lets the server relay this page's notices as the buyer
+  socket = new WebSocket(`${WS_BASE}/ws/room/${roomHash}/?buyer_hash=${encodeURIComponent(buyerHash)}`);
 
   socket.addEventListener("open", () => {
     console.log("[WS] Connected");
     reconnectAttempts = 0;
     clearTimeout(reconnectTimer);
+    sendPresence();
   });
 
   socket.addEventListener("message", (event) => {
@@ -43,6 +46,15 @@ function connectWebSocket() {
   });
 }
 
+// Typing and presence notices for the other party; the server adds who sent them
+function sendSocketMessage(msg) {
+  if (socket && socket.readyState === WebSocket.OPEN) socket.send(JSON.stringify(msg));
+}
+
+function sendPresence() {
+  sendSocketMessage({ type: "presence", status: document.hidden ? "away" : "online" });
+}
+
 function handleSocketMessage(msg) {
   console.log("[WS] Received:", msg.type, msg.data);
 
@@ -60,25 +72,25 @@ function handleSocketMessage(msg) {
     case "edited":
     case "created": {
       showNotification("The seller has updated the invoice. Please review.", "info");
-      loadRoom();
+      if (msg.data) renderRoom(msg.data);
       break;
     }
 
     case "approved": {
       showNotification("Invoice approved!", "success");
-      loadRoom();
+      if (msg.data) renderRoom(msg.data);
       break;
     }
 
     case "disapproved": {
       showNotification("Invoice disapproved. Awaiting seller revision.", "warning");
-      loadRoom();
+      if (msg.data) renderRoom(msg.data);
       break;
     }
 
     case "paid": {
       showNotification("Invoice marked as paid. Awaiting seller confirmation.", "info");
-      loadRoom();
+      if (msg.data) renderRoom(msg.data);
       break;
     }
 
@@ -99,6 +111,20 @@ function handleSocketMessage(msg) {
       break;
     }
 
+    case "presence": {
+      if (msg.actor === "seller" && msg.status === "online") {
+        showNotification("The seller is online.", "info");
+      }
+      break;
+    }
+
+    case "typing": {
+      if (msg.actor === "seller" && msg.active) {
+        showNotification("The seller is editing the invoice...", "info");
+      }
+      break;
+    }
+
     default:
       console.log("[WS] Unhandled message type:", msg.type);
   }
@@ -188,6 +214,7 @@ function renderInvoiceItems(invoice) {
 }
 
 function showInvoice(invoice) {
+  invoiceVersion = invoice.version;
   const header = document.getElementById("invoiceHeader");
   if (header) {
     header.innerHTML = `
@@ -291,12 +318,6 @@ async function updateInvoiceStatus(action) {
     "mark-paid": `${API_BASE}/api/buyer/${roomHash}/mark-paid/`,
   };
 
-  const wsActions = {
-    approve:     "approved",
-    disapprove:  "disapproved",
-    "mark-paid": "paid",
-  };
-
   const loadingModal = document.getElementById("loadingModal");
   const buttons      = ["approveBtn", "disapproveBtn", "markPaidBtn"]
     .map((id) => document.getElementById(id))
@@ -309,7 +330,7 @@ async function updateInvoiceStatus(action) {
     const response = await fetch(endpoints[action], {
       method:  "POST",
       headers: { "Content-Type": "application/json" },
-      body:    JSON.stringify({ buyer_hash: buyerHash }),
+      body:    JSON.stringify({ buyer_hash: buyerHash, version: invoiceVersion }),
     });
 
     const data = await response.json();
@@ -318,10 +339,9 @@ async function updateInvoiceStatus(action) {
       showNotification(`Invoice ${action}d successfully!`, "success");
 
       if (data.invoice) showInvoice(data.invoice);
-
-      if (socket && socket.readyState === WebSocket.OPEN) {
-        socket.send(JSON.stringify({ type: wsActions[action] }));
-      }
+    } else if (response.status === 409) {
+      showNotification(data.error, "error");
+      loadRoom();
     } else {
       showNotification(data.error || `Failed to ${action} invoice`, "error");
     }
@@ -334,26 +354,28 @@ async function updateInvoiceStatus(action) {
   }
 }
 
+function renderRoom(data) {
+  if (data.buyer?.buyer_hash === buyerHash) {
+    renderSellerInfo(data.seller);
+    if (data.invoice) {
+      if (data.invoice.status === "finalized") {
+        redirectToProof();
+        return;
+      }
+      showInvoice(data.invoice);
+    }
+  } else {
+    const unauth = document.querySelector(".unauthorized");
+    if (unauth) unauth.style.display = "block";
+  }
+}
+
 async function loadRoom() {
   try {
     const res = await fetch(`${API_BASE}/api/room/${roomHash}/`);
     if (!res.ok) throw new Error("Room not found");
 
-    const data = await res.json();
-
-    if (data.buyer?.buyer_hash === buyerHash) {
-      renderSellerInfo(data.seller);
-      if (data.invoice) {
-        if (data.invoice.status === "finalized") {
-          redirectToProof();
-          return;
-        }
-        showInvoice(data.invoice);
-      }
-    } else {
-      const unauth = document.querySelector(".unauthorized");
-      if (unauth) unauth.style.display = "block";
-    }
+    renderRoom(await res.json());
   } catch (err) {
     console.error("[loadRoom]", err);
     alert(err.message === "Room not found" ? "Room not found." : "Failed to load room data.");
@@ -365,6 +387,8 @@ document.addEventListener("DOMContentLoaded", () => {
   document.getElementById("disapproveBtn")?.addEventListener("click", () => updateInvoiceStatus("disapprove"));
   document.getElementById("markPaidBtn")?.addEventListener("click", () => updateInvoiceStatus("mark-paid"));
 
+  document.addEventListener("visibilitychange", sendPresence);
+
   loadRoom();
   connectWebSocket();
 });
\ No newline at end of file
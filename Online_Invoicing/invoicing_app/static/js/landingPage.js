@@ -253,7 +253,7 @@ async function handleBuyerRoomSubmit(input) {
             setTimeout(() => inputPopup.remove(), 200);
         }
 
-        const response = await fetch(`${CONFIG.API_BASE}/api/room/${roomHash}/`);
+        const response = await fetch(`${CONFIG.API_BASE}/api/room/${roomHash}/exists/`);
         if (!response.ok) throw new Error(response.status === 404 ? 'Room not found' : 'Server error');
 
         const data = await response.json();
@@ -358,6 +358,9 @@ function handleSecretKeyFailure(status, data) {
             alert('Invalid key. Too many failed attempts. Please wait 30 seconds.');
             lockFields('Locked');
         }
+    } else if (status === 429) {
+        alert(data.error);
+        lockFields('Locked');
     } else {
         alert(data.error || 'Server error occurred. Please try again.');
     }
@@ -432,6 +435,10 @@ function handleRoomHashFailure(status, data, input) {
             document.getElementById('roomHashPopup')?.remove();
             lockFields('Locked');
         }
+    } else if (status === 429) {
+        alert(data.error);
+        document.getElementById('roomHashPopup')?.remove();
+        lockFields('Locked');
     } else {
         alert(data.error || 'Server error occurred. Please try again.');
     }
@@ -4,11 +4,22 @@ const WS_BASE  = API_BASE.replace(/^http/, "ws");
 
 const pathParts = window.location.pathname.split("/").filter(Boolean);
 const roomHash  = pathParts[1]; 
+// Capability token for the seller API, issued with the page after authentication
+const sellerToken = document.querySelector('meta[name="seller-token"]')?.content || "";
+
+// Tokens expire after SELLER_TOKEN_MAX_AGE; reloading the page embeds a fresh one
+function reloadOnExpiredToken(status) {
+  if (status !== 403) return false;
+  alert("Your seller session has expired. The page will reload.");
+  window.location.reload();
+  return true;
+}
 
 let socket            = null;
 let reconnectAttempts = 0;
 const MAX_RECONNECT   = 5;
 let reconnectTimer    = null;
+let invoiceVersion    = null;
 
 function connectWebSocket() {
   if (socket && socket.readyState === WebSocket.OPEN) return;
@@ -19,6 +30,7 @@ function connectWebSocket() {
     console.log("[WS] Connected");
     reconnectAttempts = 0;
     clearTimeout(reconnectTimer);
+    sendPresence();
   });
 
   socket.addEventListener("message", (event) => {
@@ -42,6 +54,15 @@ function connectWebSocket() {
   });
 }
 
+// Typing and presence notices for the other party; the server adds who sent them
+function sendSocketMessage(msg) {
+  if (socket && socket.readyState === WebSocket.OPEN) socket.send(JSON.stringify(msg));
+}
+
+function sendPresence() {
+  sendSocketMessage({ type: "presence", status: document.hidden ? "away" : "online" });
+}
+
 function handleSocketMessage(msg) {
   console.log("[WS] Received:", msg.type, msg.data);
 
@@ -99,7 +120,7 @@ function handleSocketMessage(msg) {
     case "paid": {
       showNotification("Buyer marked invoice as paid. Please confirm payment.", "info");
       showBuyerNotifModal("paid");
-      loadRoomData();
+      if (msg.data) renderRoomData(msg.data);
       break;
     }
 
@@ -129,6 +150,13 @@ function handleSocketMessage(msg) {
       break;
     }
 
+    case "presence": {
+      if (msg.actor === "buyer" && msg.status === "online") {
+        showNotification("The buyer is viewing the invoice.", "info");
+      }
+      break;
+    }
+
     default:
       console.log("[WS] Unhandled message type:", msg.type);
   }
@@ -309,6 +337,7 @@ function populateSellerFields(seller) {
 function createItemBlock(itemData = null) {
   const block = document.createElement("div");
   block.classList.add("item-block");
+  if (itemData?.id != null) block.dataset.itemId = itemData.id;
 
   const productValue     = itemData?.product_name || "";
   const descriptionValue = itemData?.description  || "";
@@ -369,7 +398,9 @@ function collectItems() {
     const unit_price  = parseFloat(block.querySelector('[name="unit_price[]"]').value) || 0;
 
     if (product && quantity > 0 && unit_price > 0) {
-      items.push({ product_name: product, description, quantity, unit_price });
+      const item = { product_name: product, description, quantity, unit_price };
+      if (block.dataset.itemId) item.id = parseInt(block.dataset.itemId, 10);
+      items.push(item);
     }
   });
   return items;
@@ -377,6 +408,7 @@ function collectItems() {
 
 function populateInvoiceFields(data) {
   const invoice = data.invoice;
+  invoiceVersion = invoice.version;
   document.getElementById("invoiceDate").value   = invoice.invoice_date   || "";
   document.getElementById("dueDate").value       = invoice.due_date       || "";
   document.getElementById("paymentMethod").value = invoice.payment_method || "";
@@ -483,7 +515,7 @@ async function submitInvoiceForm() {
 
   if (items.length > 1) {
     url     = `${API_BASE}/api/seller/${roomHash}/edit-invoice/`;
-    payload = { invoice_date: invoiceDate, due_date: dueDate, payment_method: paymentMethod, items };
+    payload = { invoice_date: invoiceDate, due_date: dueDate, payment_method: paymentMethod, items, version: invoiceVersion };
   } else {
     const item = items[0];
     url     = `${API_BASE}/api/seller/${roomHash}/edit-single-invoice/`;
@@ -494,25 +526,26 @@ async function submitInvoiceForm() {
       description:    item.description,
       quantity:       item.quantity,
       unit_price:     item.unit_price,
+      version:        invoiceVersion,
     };
   }
 
   try {
     const response = await fetch(url, {
       method:  "PUT",
-      headers: { "Content-Type": "application/json" },
+      headers: { "Content-Type": "application/json", "X-Seller-Token": sellerToken },
       body:    JSON.stringify(payload),
     });
+    if (reloadOnExpiredToken(response.status)) return;
     const data = await response.json();
 
     if (response.ok) {
       showNotification("Invoice updated successfully!", "success");
 
       lockSellerForm();
-
-      if (socket && socket.readyState === WebSocket.OPEN) {
-        socket.send(JSON.stringify({ type: "edited" }));
-      }
+    } else if (response.status === 409) {
+      alert(data.error);
+      loadRoomData();
     } else {
       alert(data.error || "Failed to update invoice.");
     }
@@ -538,16 +571,14 @@ async function confirmPayment() {
     const csrfToken = document.querySelector('meta[name="csrf-token"]')?.getAttribute("content");
     const res = await fetch(`${API_BASE}/api/seller/${roomHash}/confirm-payment/`, {
       method:  "POST",
-      headers: { "X-CSRFToken": csrfToken || "" },
+      headers: { "Content-Type": "application/json", "X-CSRFToken": csrfToken || "", "X-Seller-Token": sellerToken },
+      body:    JSON.stringify({ version: invoiceVersion }),
     });
 
+    if (reloadOnExpiredToken(res.status)) return;
     const result = await res.json();
 
     if (res.ok && result.invoice_status === "finalized") {
-      if (socket && socket.readyState === WebSocket.OPEN) {
-        socket.send(JSON.stringify({ type: "confirmed" }));
-      }
-
       try {
         const encryptRes    = await fetch(`${API_BASE}/invoice/${roomHash}/encrypt/`, { method: "POST" });
         const encryptResult = await encryptRes.json();
@@ -560,6 +591,9 @@ async function confirmPayment() {
         ? result.redirect_url
         : `${window.location.origin}${result.redirect_url}`;
       window.location.href = proofUrl;
+    } else if (res.status === 409) {
+      alert(result.error);
+      loadRoomData();
     } else {
       alert(result.error || "Failed to confirm payment.");
     }
@@ -572,29 +606,30 @@ async function confirmPayment() {
   }
 }
 
-async function loadRoomData() {
-  try {
-    const response = await fetch(`${API_BASE}/api/room/${roomHash}/`);
-    if (!response.ok) throw new Error("Room not found");
-
-    const data = await response.json();
+function renderRoomData(data) {
+  if (data.invoice?.status === "finalized") {
+    redirectToProof();
+    return;
+  }
 
-    if (data.invoice?.status === "finalized") {
-      redirectToProof();
-      return;
-    }
+  populateSellerFields(data.seller);
 
-    populateSellerFields(data.seller);
+  if (data.invoice) {
+    populateInvoiceFields(data);
+    applyInvoiceStatusToSellerRoom(data.invoice.status, data);
+  }
 
-    if (data.invoice) {
-      populateInvoiceFields(data);
-      applyInvoiceStatusToSellerRoom(data.invoice.status, data);
-    }
+  if (data.is_buyer_assigned || data.has_buyer) {
+    showBuyerJoinedModal();
+  }
+}
 
-    if (data.is_buyer_assigned || data.has_buyer) {
-      showBuyerJoinedModal();
-    }
+async function loadRoomData() {
+  try {
+    const response = await fetch(`${API_BASE}/api/room/${roomHash}/`);
+    if (!response.ok) throw new Error("Room not found");
 
+    renderRoomData(await response.json());
   } catch (err) {
     console.error("[loadRoomData]", err);
     alert(err.message === "Room not found" ? "Room not found." : "Failed to load room data.");
@@ -646,6 +681,20 @@ document.addEventListener("DOMContentLoaded", () => {
     if (e.target.matches('[name="quantity[]"], [name="unit_price[]"]')) recalcTotals();
   });
 
+  // One typing notice when editing starts and one after a pause
+  let typingTimer = null;
+  ["invoiceForm", "sellerForm"].forEach((id) => {
+    document.getElementById(id)?.addEventListener("input", () => {
+      if (!typingTimer) sendSocketMessage({ type: "typing", active: true });
+      clearTimeout(typingTimer);
+      typingTimer = setTimeout(() => {
+        typingTimer = null;
+        sendSocketMessage({ type: "typing", active: false });
+      }, 2000);
+    });
+  });
+  document.addEventListener("visibilitychange", sendPresence);
+
   loadRoomData();
   connectWebSocket();
 });
\ No newline at end of file
@@ -4,6 +4,15 @@ const API_BASE = "https://nontaxinvoiceproof.pythonanywhere.com";
 
 const pathParts = window.location.pathname.split('/').filter(Boolean);
 const roomHash = pathParts[1];
+const sellerToken = document.querySelector('meta[name="seller-token"]')?.content || '';
+
+// Tokens expire after SELLER_TOKEN_MAX_AGE; reloading the page embeds a fresh one
+function reloadOnExpiredToken(status) {
+  if (status !== 403) return false;
+  alert("Your seller session has expired. The page will reload.");
+  window.location.reload();
+  return true;
+}
 
 document.getElementById('roomHash').textContent = roomHash;
 const shareableInput = document.getElementById('shareableLink');
@@ -14,7 +23,8 @@ document.getElementById('confirmPaymentBtn').addEventListener('click', async ()
   try {
     const apiUrl = `${window.location.origin}/api/seller/${roomHash}/confirm-payment/`;
 
-    const res = await fetch(apiUrl, { method: 'POST' });
+    const res = await fetch(apiUrl, { method: 'POST', headers: { 'X-Seller-Token': sellerToken } });
+    if (reloadOnExpiredToken(res.status)) return;
     const result = await res.json();
 
     if (res.ok && result.invoice_status === 'finalized') {
@@ -111,10 +121,11 @@ async function submitInvoiceForm(formElement) {
   try {
     const response = await fetch(`${API_BASE}/api/seller/${roomHash}/edit-invoice/`, {
       method: 'PUT',
+      headers: { 'X-Seller-Token': sellerToken },
       body: formData
     });
 
-
+    if (reloadOnExpiredToken(response.status)) return;
     const data = await response.json();
 
     if (response.ok) {
@@ -1,3 +1,1227 @@
-from django.test import TestCase
+import json
+import threading
+import time
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO, StringIO
+from datetime import date
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from channels.testing import WebsocketCommunicator
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from .capabilities import issue_seller_token, load_buyer_room
+from .invoice_services import apply_seller_edit
+from .encryption_utils import InvoiceEncryption, DerivedKeyCache
+from .realtime import room_group_name
+from . import state_machine, verification_counter, ws_protocol
+from . import room_cache, throttle
+from .reports import pdf_cache, prerender
+from .models import (
+    Room, Seller, Buyer, Invoice, InvoiceItem, NegotiationHistory, EncryptedInvoiceRecord,
+    MultiItemNegotiationHistory,
+)
+
+
+def make_room(items=0, history=3):
+    room = Room.objects.create()
+    seller = Seller(room=room, fullname="Seller")
+    seller.set_secret_key("Str0ng!Key")
+    seller.save()
+    Buyer.objects.create(room=room, fullname="Buyer")
+    invoice = Invoice.objects.create(
+        room=room,
+        invoice_date=date(2025, 1, 1),
+        description="Multi-item invoice" if items else "Single item",
+        quantity=1 if not items else 0,
+        unit_price=Decimal("10.00") if not items else 0,
+        payment_method="cash",
+    )
+    for i in range(items):
+        InvoiceItem.objects.create(invoice=invoice, product_name=f"Item {i}", quantity=2, unit_price=Decimal("5.00"))
+    for i in range(history):
+        NegotiationHistory.objects.create(room=room, action="edited", actor="seller", notes=f"Edit {i}")
+    return room
+
+
+def seller_headers(room):
+    return {"HTTP_X_SELLER_TOKEN": issue_seller_token(room.room_hash)}
+
+
+class RoomDetailQueryBudgetTests(TestCase):
+    def test_single_item_room_detail(self):
+        room = make_room(history=5)
+        with self.assertNumQueries(3):
+            response = self.client.get(f"/api/room/{room.room_hash}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["history"]), 5)
+
+    def test_multi_item_room_detail(self):
+        room = make_room(items=20, history=5)
+        with self.assertNumQueries(3):
+            response = self.client.get(f"/api/room/{room.room_hash}/")
+        self.assertEqual(response.status_code, 200)
+        invoice = response.json()["invoice"]
+        self.assertEqual(len(invoice["items"]), 20)
+        self.assertEqual(Decimal(str(invoice["total_amount"])), Decimal("200.00"))
+
+    def test_write_response_includes_new_history(self):
+        room = make_room(history=1)
+        response = self.client.post(
+            f"/api/buyer/{room.room_hash}/approve/",
+            {"buyer_hash": room.buyer.buyer_hash},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["history"][0]["action"], "approved")
+
+
+class RoomConditionalGetTests(TestCase):
+    def bump(self, room):
+        with self.captureOnCommitCallbacks(execute=True):
+            room_cache.bump(room.room_hash)
+
+    def test_matching_etag_is_answered_without_serializing(self):
+        room = make_room(items=3)
+        response = self.client.get(f"/api/room/{room.room_hash}/")
+        etag = response["ETag"]
+        self.assertTrue(response.has_header("Last-Modified"))
+
+        # No state cache: validators come from the database
+        with mock.patch("invoicing_app.views.RoomDetailSerializer") as serializer, self.assertNumQueries(1):
+            response = self.client.get(f"/api/room/{room.room_hash}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        serializer.assert_not_called()
+
+    def test_etag_changes_with_room_state(self):
+        room = make_room()
+        url = f"/api/room/{room.room_hash}/"
+        etag = self.client.get(url)["ETag"]
+
+        NegotiationHistory.objects.create(room=room, action="approved", actor="buyer")
+        self.bump(room)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+        etag = response["ETag"]
+        invoice = room.invoice
+        invoice.status = "pending"
+        invoice.save()
+        self.bump(room)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["invoice"]["status"], "pending")
+
+    def test_unknown_room_with_etag(self):
+        response = self.client.get("/api/room/missing/", HTTP_IF_NONE_MATCH='"abc"')
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(ROOM_STATE_CACHE="default")
+class RoomStateCacheTests(TestCase):
+    def setUp(self):
+        room_cache.get_cache().clear()
+        room_cache.reset_stats()
+
+    def test_repeat_reads_skip_the_database(self):
+        room = make_room(items=3)
+        url = f"/api/room/{room.room_hash}/"
+        first = self.client.get(url)
+
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(room_cache.stats(), {"hits": 2, "misses": 1, "hit_ratio": 2 / 3})
+
+    def test_write_views_invalidate_on_commit(self):
+        room = make_room()
+        url = f"/api/room/{room.room_hash}/"
+        self.assertEqual(self.client.get(url).json()["invoice"]["status"], "draft")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f"/api/room/{room.room_hash}/start-negotiation/", **seller_headers(room))
+        self.assertEqual(self.client.get(url).json()["invoice"]["status"], "negotiating")
+
+    def test_lost_version_counter_is_not_reused(self):
+        room = make_room()
+        version, _ = room_cache.lookup(room.room_hash)
+        room_cache.store(room.room_hash, version, ("etag", 0, {"stale": True}))
+        room_cache.get_cache().delete(f"room_state:version:{room.room_hash}")
+
+        _, state = room_cache.lookup(room.room_hash)
+        self.assertIsNone(state)
+
+    def test_unknown_rooms_leave_no_cache_keys(self):
+        self.assertEqual(self.client.get("/api/room/no-such-room/").status_code, 404)
+        self.assertIsNone(room_cache.get_cache().get("room_state:version:no-such-room"))
+
+    @override_settings(ROOM_STATE_CACHE_TIMEOUT=60)
+    def test_version_counters_expire(self):
+        room = make_room()
+        self.client.get(f"/api/room/{room.room_hash}/")
+        with mock.patch("django.core.cache.backends.locmem.time.time", return_value=time.time() + 60 * 4 + 1):
+            self.assertIsNone(room_cache.get_cache().get(f"room_state:version:{room.room_hash}"))
+
+    @override_settings(ROOM_STATE_CACHE=None)
+    def test_disabled_cache_reads_the_database(self):
+        room = make_room()
+        url = f"/api/room/{room.room_hash}/"
+        self.assertEqual(self.client.get(url).json()["invoice"]["status"], "draft")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f"/api/room/{room.room_hash}/start-negotiation/", **seller_headers(room))
+        self.assertEqual(self.client.get(url).json()["invoice"]["status"], "negotiating")
+        self.assertIsNone(caches["default"].get(f"room_state:version:{room.room_hash}"))
+        self.assertEqual(room_cache.stats()["hits"], 0)
+
+    def test_metrics_are_staff_only(self):
+        self.assertEqual(self.client.get("/api/metrics/cache/").status_code, 403)
+        self.client.force_login(User.objects.create_user("ops", is_staff=True))
+        body = self.client.get("/api/metrics/cache/").json()
+        self.assertIn("hit_ratio", body["room_state"])
+        self.assertIn("hit_ratio", body["derived_keys"])
+
+
+@override_settings(ROOM_HISTORY_EMBED_LIMIT=3, HISTORY_PAGE_SIZE=4)
+class RoomHistoryPaginationTests(TestCase):
+    def test_room_detail_embeds_latest_entries_only(self):
+        room = make_room(history=10)
+        with self.assertNumQueries(3):
+            response = self.client.get(f"/api/room/{room.room_hash}/")
+        notes = [entry["notes"] for entry in response.json()["history"]]
+        self.assertEqual(notes, ["Edit 9", "Edit 8", "Edit 7"])
+
+    def test_pages_walk_every_entry_once(self):
+        room = make_room(history=10)
+        # Identical timestamps must still page deterministically on id
+        NegotiationHistory.objects.filter(room=room).update(created_at=timezone.now())
+
+        seen, cursor = [], None
+        while True:
+            params = {"cursor": cursor} if cursor else {}
+            with self.assertNumQueries(2):
+                response = self.client.get(f"/api/room/{room.room_hash}/history/", params)
+            body = response.json()
+            seen.extend(entry["notes"] for entry in body["results"])
+            cursor = body["next_cursor"]
+            if cursor is None:
+                break
+
+        self.assertEqual(seen, [f"Edit {i}" for i in range(9, -1, -1)])
+
+    def test_multi_item_history_source(self):
+        room = make_room(items=1, history=0)
+        for i in range(5):
+            MultiItemNegotiationHistory.objects.create(room=room, action="edited_item", actor="seller", notes=f"Item edit {i}")
+
+        response = self.client.get(f"/api/room/{room.room_hash}/history/", {"source": "multi", "limit": 2})
+        body = response.json()
+        self.assertEqual([entry["notes"] for entry in body["results"]], ["Item edit 4", "Item edit 3"])
+        self.assertIsNotNone(body["next_cursor"])
+
+    def test_invalid_cursor(self):
+        room = make_room()
+        response = self.client.get(f"/api/room/{room.room_hash}/history/", {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_proof_page_limits_history(self):
+        room = make_room(history=10)
+        response = self.client.get(f"/proof_transaction/{room.room_hash}/")
+        self.assertEqual(len(response.context["history"]), 3)
+
+
+class RoomExistsTests(TestCase):
+    def test_probe_is_one_query_without_serializing(self):
+        room = make_room(items=3)
+        with self.assertNumQueries(1), mock.patch("invoicing_app.views.RoomDetailSerializer") as serializer:
+            response = self.client.get(f"/api/room/{room.room_hash}/exists/")
+        serializer.assert_not_called()
+        self.assertEqual(response.json(), {
+            "exists": True, "room_hash": room.room_hash, "is_buyer_assigned": False, "invoice_status": "draft",
+        })
+
+    def test_missing_room(self):
+        self.assertEqual(self.client.get("/api/room/missing/exists/").status_code, 404)
+
+    def test_head(self):
+        room = make_room(history=0)
+        response = self.client.head(f"/api/room/{room.room_hash}/exists/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(self.client.head("/api/room/missing/exists/").status_code, 404)
+
+
+class EncryptedInvoiceRecordFormatTests(TestCase):
+    def setUp(self):
+        self.room = make_room()
+        self.room.invoice.status = "finalized"
+        self.room.invoice.save()
+
+    def decrypt(self):
+        return self.client.post(
+            f"/api/decrypt-invoice/{self.room.room_hash}/",
+            {"room_hash": self.room.room_hash},
+            content_type="application/json",
+        )
+
+    def test_v2_record_derives_key_once(self):
+        with mock.patch.object(InvoiceEncryption, "_derive_key", wraps=InvoiceEncryption._derive_key) as derive:
+            response = self.client.post(f"/invoice/{self.room.room_hash}/encrypt/")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(derive.call_count, 1)
+
+            derive.reset_mock()
+            response = self.decrypt()
+            self.assertEqual(derive.call_count, 1)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["seller"]["fullname"], "Seller")
+        self.assertEqual(self.room.encrypted_invoice.format_version, EncryptedInvoiceRecord.FORMAT_V2)
+
+    def test_v1_record_still_verifies(self):
+        record = EncryptedInvoiceRecord(
+            room=self.room,
+            encrypted_seller_data=InvoiceEncryption.encrypt_data({"fullname": "Seller"}, self.room.room_hash),
+            encrypted_buyer_data=InvoiceEncryption.encrypt_data({"fullname": "Buyer"}, self.room.room_hash),
+            encrypted_invoice_data=InvoiceEncryption.encrypt_data({"status": "finalized"}, self.room.room_hash),
+            encrypted_items_data=InvoiceEncryption.encrypt_data({"items": []}, self.room.room_hash),
+        )
+        record.data_hash = record.generate_data_hash()
+        record.save()
+
+        response = self.decrypt()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["buyer"], {"fullname": "Buyer"})
+
+
+@override_settings(VERIFICATION_WRITE_BEHIND=True, VERIFICATION_FLUSH_INTERVAL=3600)
+class VerificationCounterTests(TestCase):
+    def setUp(self):
+        verification_counter.get_cache().clear()
+        # The background flusher thread is exercised through flush_dirty()
+        patcher = mock.patch("invoicing_app.verification_counter._start_flusher")
+        self.start_flusher = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.room = make_room()
+        self.room.invoice.status = "finalized"
+        self.room.invoice.save()
+        self.client.post(f"/invoice/{self.room.room_hash}/encrypt/")
+        self.record = EncryptedInvoiceRecord.objects.get(room=self.room)
+
+    def decrypt(self):
+        return self.client.post(
+            f"/api/decrypt-invoice/{self.room.room_hash}/",
+            {"room_hash": self.room.room_hash},
+            content_type="application/json",
+        )
+
+    def test_counts_are_deferred_but_reported(self):
+        counts = [self.decrypt().json()["metadata"]["verification_count"] for _ in range(3)]
+        self.assertEqual(counts, [1, 2, 3])
+        self.assertEqual(EncryptedInvoiceRecord.objects.get(pk=self.record.pk).verification_count, 0)
+
+        status = self.client.get(f"/api/encrypted-invoice-status/{self.room.room_hash}/").json()
+        self.assertEqual(status["verification_count"], 3)
+
+    def test_flush_command_adds_pending_counts(self):
+        self.decrypt()
+        self.decrypt()
+        out = StringIO()
+        call_command("flush_verification_counts", stdout=out)
+        self.assertIn("1 record(s)", out.getvalue())
+
+        record = EncryptedInvoiceRecord.objects.get(pk=self.record.pk)
+        self.assertEqual(record.verification_count, 2)
+        self.assertIsNotNone(record.last_verified_at)
+        self.assertEqual(verification_counter.current(record)[0], 2)
+
+        # Nothing pending any more
+        self.assertEqual(verification_counter.flush_all(), 0)
+
+    def test_process_flushes_the_records_it_counted(self):
+        self.decrypt()
+        self.start_flusher.assert_called()
+        self.assertEqual(verification_counter.flush_dirty(), 1)
+        self.assertEqual(EncryptedInvoiceRecord.objects.get(pk=self.record.pk).verification_count, 1)
+        self.assertEqual(verification_counter.flush_dirty(), 0)
+
+    def test_busy_flush_keeps_records_for_the_next_run(self):
+        self.decrypt()
+        verification_counter.get_cache().add(verification_counter.FLUSH_LOCK_KEY, 1)
+        self.assertIsNone(verification_counter.flush_dirty())
+        verification_counter.get_cache().delete(verification_counter.FLUSH_LOCK_KEY)
+        self.assertEqual(verification_counter.flush_dirty(), 1)
+
+    def test_counts_live_in_a_dedicated_cache(self):
+        self.decrypt()
+        caches["default"].clear()
+        self.assertEqual(verification_counter.flush_dirty(), 1)
+        self.assertEqual(EncryptedInvoiceRecord.objects.get(pk=self.record.pk).verification_count, 1)
+
+    @override_settings(VERIFICATION_WRITE_BEHIND=False)
+    def test_synchronous_mode(self):
+        self.decrypt()
+        self.assertEqual(EncryptedInvoiceRecord.objects.get(pk=self.record.pk).verification_count, 1)
+
+
+class SqliteTuningTests(TestCase):
+    def test_pragmas_applied_to_connections(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA synchronous")
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute("PRAGMA temp_store")
+            self.assertEqual(cursor.fetchone()[0], 2)  # MEMORY
+
+    def test_wal_on_file_databases(self):
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+
+        with tempfile.TemporaryDirectory() as tmp:
+            wrapper = DatabaseWrapper({**connection.settings_dict, "NAME": f"{tmp}/wal.sqlite3"}, alias="wal")
+            try:
+                with wrapper.cursor() as cursor:
+                    cursor.execute("PRAGMA journal_mode")
+                    self.assertEqual(cursor.fetchone()[0], "wal")
+            finally:
+                wrapper.close()
+
+
+class DerivedKeyCacheTests(TestCase):
+    def test_lru_eviction_and_counters(self):
+        cache = DerivedKeyCache(max_size=2, ttl=60)
+        cache.set("a" * 16, b"salt-a", b"key-a")
+        cache.set("b" * 16, b"salt-b", b"key-b")
+        self.assertEqual(cache.get("a" * 16, b"salt-a"), b"key-a")
+        cache.set("c" * 16, b"salt-c", b"key-c")
+
+        self.assertIsNone(cache.get("b" * 16, b"salt-b"))
+        self.assertEqual(cache.stats()["hits"], 1)
+        self.assertEqual(cache.stats()["misses"], 1)
+        self.assertEqual(cache.stats()["size"], 2)
+
+    def test_entries_expire(self):
+        cache = DerivedKeyCache(max_size=2, ttl=60)
+        with mock.patch("invoicing_app.encryption_utils.time.monotonic", return_value=1000):
+            cache.set("a" * 16, b"salt", b"key")
+        with mock.patch("invoicing_app.encryption_utils.time.monotonic", return_value=1061):
+            self.assertIsNone(cache.get("a" * 16, b"salt"))
+        self.assertEqual(cache.stats()["size"], 0)
+
+
+class ProofPdfCacheTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.room = make_room(items=2)
+        self.url = f"/proof_transaction/{self.room.room_hash}/pdf/"
+
+    def test_repeat_download_is_served_from_cache(self):
+        with mock.patch(
+            "invoicing_app.reports.pdf_cache.build_proof_transaction_pdf",
+            wraps=pdf_cache.build_proof_transaction_pdf,
+        ) as build:
+            first = self.client.get(self.url)
+            second = self.client.get(self.url)
+            self.assertEqual(build.call_count, 1)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first["Content-Type"], "application/pdf")
+        self.assertTrue(b"".join(first.streaming_content).startswith(b"%PDF"))
+        self.assertEqual(first["ETag"], second["ETag"])
+        second.close()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 304)
+
+    def test_state_change_produces_new_render(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.room.invoice.status = "finalized"
+        self.room.invoice.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        response.close()
+
+        # The superseded render is pruned after the new one is stored
+        _, files = pdf_cache.get_storage().listdir(f"proofs/{self.room.room_hash}")
+        self.assertEqual(files, [response["ETag"].strip('"') + ".pdf"])
+
+    def test_concurrent_renders_keep_the_canonical_file(self):
+        data = pdf_cache.room_proof_data(self.room)
+        digest = pdf_cache.content_digest(data, "https://example.test")
+        name = f"proofs/{self.room.room_hash}/{digest}.pdf"
+
+        def finish_other_render_first(buffer, *args, **kwargs):
+            pdf_cache.get_storage().save(name, pdf_cache.ContentFile(b"%PDF other"))
+            buffer.write(b"%PDF mine")
+
+        with mock.patch("invoicing_app.reports.pdf_cache.build_proof_transaction_pdf", finish_other_render_first):
+            cached = pdf_cache.get_or_build(self.room.room_hash, data, "https://example.test")
+
+        self.assertEqual(cached.name, name)
+        with cached.open() as handle:
+            self.assertEqual(handle.read(), b"%PDF other")
+        _, files = pdf_cache.get_storage().listdir(f"proofs/{self.room.room_hash}")
+        self.assertEqual(files, [f"{digest}.pdf"])
+
+    def test_render_pruned_before_open_is_rebuilt(self):
+        pruned = pdf_cache.CachedPdf("proofs/gone.pdf", "gone", timezone.now())
+        with mock.patch.object(pdf_cache, "lookup", side_effect=[pruned, None]) as lookup:
+            response = self.client.get(self.url)
+        self.assertEqual(lookup.call_count, 2)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b"".join(response.streaming_content).startswith(b"%PDF"))
+        _, files = pdf_cache.get_storage().listdir(f"proofs/{self.room.room_hash}")
+        self.assertEqual(len(files), 1)
+
+    def test_prerender_command_fills_missing_pdfs(self):
+        self.room.invoice.status = "finalized"
+        self.room.invoice.save()
+        make_room()  # not finalized, skipped
+
+        call_command("prerender_proof_pdfs", concurrency=1, stdout=StringIO())
+
+        with mock.patch("invoicing_app.reports.pdf_cache.build_proof_transaction_pdf") as build:
+            response = self.client.get(self.url)
+            build.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+    @override_settings(PROOF_PDF_PRERENDER=True)
+    def test_confirming_payment_prerenders_the_downloaded_pdf(self):
+        invoice = self.room.invoice
+        invoice.status = "unconfirmed_payment"
+        invoice.save()
+
+        class InlineExecutor:
+            def submit(self, fn, *args):
+                fn(*args)
+
+        # Run the queued render inline and keep the test's connection open
+        with mock.patch.object(prerender, "_get_executor", return_value=(InlineExecutor(), threading.Semaphore())), \
+                mock.patch("invoicing_app.reports.prerender.close_old_connections"), \
+                self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                f"/api/seller/{self.room.room_hash}/confirm-payment/", **seller_headers(self.room)
+            )
+        self.assertEqual(response.status_code, 200)
+
+        # The request host differs from PROOF_PDF_BASE_URL, yet the download hits the same entry
+        with mock.patch("invoicing_app.reports.pdf_cache.build_proof_transaction_pdf") as build:
+            response = self.client.get(self.url)
+            build.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+
+class ProofExportTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name, PROOF_EXPORT_WORKERS=1)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def finalized_room(self, **kwargs):
+        room = make_room(**kwargs)
+        room.invoice.status = "finalized"
+        room.invoice.seller_confirmed_at = timezone.now()
+        room.invoice.save()
+        return room
+
+    def test_requires_staff(self):
+        response = self.client.post("/api/proofs/export/", {"room_hashes": ["x" * 16]}, content_type="application/json")
+        self.assertEqual(response.status_code, 403)
+
+    def test_streams_zip_of_finalized_rooms(self):
+        self.client.force_login(User.objects.create_user("accounting", is_staff=True))
+        rooms = [self.finalized_room(), self.finalized_room(items=3)]
+        make_room()  # still a draft
+
+        today = timezone.now().date().isoformat()
+        response = self.client.post(
+            "/api/proofs/export/",
+            {"confirmed_from": today, "confirmed_to": today},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+
+        archive = zipfile.ZipFile(BytesIO(b"".join(response.streaming_content)))
+        self.assertEqual(
+            sorted(archive.namelist()),
+            sorted(f"Proof_Transaction_{room.room_hash}.pdf" for room in rooms),
+        )
+        self.assertTrue(archive.read(archive.namelist()[0]).startswith(b"%PDF"))
+
+    def test_render_window_is_bounded_and_abandoned_on_close(self):
+        started = []
+
+        def render(room_hash, base_url):
+            started.append(room_hash)
+            time.sleep(0.05)
+            return room_hash
+
+        hashes = [f"room{i}" for i in range(20)]
+        with mock.patch("invoicing_app.reports.prerender.render_room", side_effect=render), \
+                mock.patch("invoicing_app.reports.prerender.close_old_connections"):
+            renders = prerender.render_many(hashes, "http://testserver", concurrency=2)
+            self.assertEqual(next(renders), ("room0", "room0"))
+            renders.close()
+            time.sleep(0.2)
+            # Two in flight, plus the one submitted when the first was handed out
+            self.assertLessEqual(len(started), 3)
+
+            self.assertEqual([cached for _, cached in prerender.render_many(hashes, "", concurrency=3)], hashes)
+
+
+@override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+class RoomStatePushTests(TestCase):
+    def test_state_change_is_pushed_to_room_group(self):
+        room = make_room()
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(room_group_name(room.room_hash), channel)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                f"/api/buyer/{room.room_hash}/approve/",
+                {"buyer_hash": room.buyer.buyer_hash},
+                content_type="application/json",
+            )
+
+        message = json.loads(async_to_sync(layer.receive)(channel)["text"])
+        self.assertEqual(message["type"], "approved")
+        self.assertEqual(message["data"]["invoice"]["status"], "pending")
+
+
+# Browsers send the page's origin with every socket handshake
+SAME_ORIGIN = (b"origin", b"http://testserver")
+
+
+class AsgiWebsocketTests(TransactionTestCase):
+    def test_websocket_route_reaches_negotiation_consumer(self):
+        from Online_Invoicing.asgi import application
+
+        room = make_room()
+
+        async def scenario():
+            communicator = WebsocketCommunicator(application, f"/ws/room/{room.room_hash}/", headers=[SAME_ORIGIN])
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            state = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return state
+
+        state = async_to_sync(scenario)()
+        self.assertEqual(state["type"], "room_state")
+        self.assertEqual(state["data"]["invoice_status"], "draft")
+
+    def test_other_origins_are_refused(self):
+        from Online_Invoicing.asgi import application
+
+        room = make_room()
+
+        async def scenario(headers):
+            communicator = WebsocketCommunicator(application, f"/ws/room/{room.room_hash}/", headers=headers)
+            connected, _ = await communicator.connect()
+            await communicator.disconnect()
+            return connected
+
+        self.assertFalse(async_to_sync(scenario)([(b"origin", b"https://evil.example")]))
+        self.assertFalse(async_to_sync(scenario)([]))
+
+
+class WebsocketProtocolTests(TransactionTestCase):
+    def test_parse_accepts_only_declared_messages(self):
+        typing = {"type": "typing", "active": True}
+        self.assertEqual(ws_protocol.parse(json.dumps(typing)), typing)
+        for bad in (
+            "not json", "[]", '{"type": ["typing"]}',
+            json.dumps({"type": "room_state", "data": {}}),
+            json.dumps({"type": "state_changed", "event": "approved"}),
+            json.dumps({**typing, "actor": "seller"}),
+            json.dumps({**typing, "active": "yes"}),
+            json.dumps({"type": "presence", "status": "hiding"}),
+        ):
+            self.assertIsNone(ws_protocol.parse(bad), bad)
+
+        text = json.dumps(typing)
+        self.assertIsNone(ws_protocol.parse(text, max_bytes=len(text) - 1))
+
+    def seller_cookie(self, room):
+        session = self.client.session
+        session["authenticated_room_hash"] = room.room_hash
+        session.save()
+        return [(b"cookie", f"sessionid={session.session_key}".encode())]
+
+    def run_sockets(self, room, connections, scenario):
+        from Online_Invoicing.asgi import application
+
+        async def run():
+            sockets = [
+                WebsocketCommunicator(application, f"/ws/room/{room.room_hash}/{query}", headers=[SAME_ORIGIN, *headers])
+                for query, headers in connections
+            ]
+            for socket in sockets:
+                await socket.connect()
+                await socket.receive_json_from()
+            try:
+                return await scenario(*sockets)
+            finally:
+                for socket in sockets:
+                    await socket.disconnect()
+
+        return async_to_sync(run)()
+
+    def test_actor_comes_from_the_connection(self):
+        room = make_room(history=0)
+        buyer = (f"?buyer_hash={room.buyer.buyer_hash}", [])
+        seller = ("", self.seller_cookie(room))
+        anonymous = ("?buyer_hash=guess", [])
+
+        async def scenario(buyer_socket, seller_socket, listener):
+            await listener.send_json_to({"type": "presence", "status": "online"})
+            await buyer_socket.send_json_to({"type": "typing", "active": True, "actor": "seller"})
+            self.assertTrue(await seller_socket.receive_nothing())
+
+            await buyer_socket.send_json_to({"type": "presence", "status": "online"})
+            self.assertEqual(
+                await seller_socket.receive_json_from(), {"type": "presence", "status": "online", "actor": "buyer"}
+            )
+            await seller_socket.send_json_to({"type": "typing", "active": True})
+            self.assertEqual((await buyer_socket.receive_json_from())["actor"], "seller")
+            self.assertEqual((await listener.receive_json_from())["actor"], "buyer")
+            self.assertEqual((await listener.receive_json_from())["actor"], "seller")
+            self.assertTrue(await buyer_socket.receive_nothing())
+            self.assertTrue(await seller_socket.receive_nothing())
+
+        self.run_sockets(room, [buyer, seller, anonymous], scenario)
+
+    @override_settings(WS_MESSAGE_RATE=(3, 60), WS_COALESCE_INTERVAL=0)
+    def test_messages_are_limited_per_connection(self):
+        room = make_room(history=0)
+
+        async def scenario(sender, peer):
+            for active in (True, False, True, False, True):
+                await sender.send_json_to({"type": "typing", "active": active})
+            received = [(await peer.receive_json_from())["active"] for _ in range(3)]
+            self.assertEqual(received, [True, False, True])
+            self.assertTrue(await peer.receive_nothing())
+
+        self.run_sockets(room, [(f"?buyer_hash={room.buyer.buyer_hash}", []), ("", [])], scenario)
+
+    @override_settings(WS_COALESCE_INTERVAL=0.3)
+    def test_typing_bursts_are_coalesced(self):
+        room = make_room(history=0)
+
+        async def scenario(sender, peer):
+            for active in (True, False, True, False):
+                await sender.send_json_to({"type": "typing", "active": active})
+            self.assertTrue((await peer.receive_json_from())["active"])
+            self.assertTrue(await peer.receive_nothing(timeout=0.1))
+            self.assertFalse((await peer.receive_json_from(timeout=1))["active"])
+            self.assertTrue(await peer.receive_nothing(timeout=0.5))
+
+        self.run_sockets(room, [(f"?buyer_hash={room.buyer.buyer_hash}", []), ("", [])], scenario)
+
+
+class SellerAuthenticateTests(TestCase):
+    def setUp(self):
+        self.seller = make_room(history=0).seller
+        self.legacy = make_room(history=0).seller
+        Seller.objects.filter(pk=self.legacy.pk).update(secret_key_fingerprint=None)
+
+    def test_fingerprint_hit_hashes_once(self):
+        with mock.patch("invoicing_app.models.check_password", return_value=True) as check:
+            self.assertEqual(Seller.authenticate("Str0ng!Key").pk, self.seller.pk)
+        self.assertEqual(check.call_count, 1)
+
+    def test_miss_tries_legacy_rows_by_default(self):
+        with mock.patch("invoicing_app.models.check_password", return_value=False) as check:
+            self.assertIsNone(Seller.authenticate("wrong"))
+        self.assertEqual(check.call_count, 1)
+
+    @override_settings(SELLER_LEGACY_KEY_SCAN=False)
+    def test_miss_does_not_hash_legacy_rows_once_scan_is_off(self):
+        with mock.patch("invoicing_app.models.check_password") as check:
+            self.assertIsNone(Seller.authenticate("wrong"))
+        check.assert_not_called()
+
+    def test_legacy_scan_backfills_on_login(self):
+        # A key of its own, so only the legacy row can match
+        self.legacy.set_secret_key("Legacy!Key9")
+        self.legacy.save()
+        Seller.objects.filter(pk=self.legacy.pk).update(secret_key_fingerprint=None)
+
+        self.assertEqual(Seller.authenticate("Legacy!Key9").pk, self.legacy.pk)
+        self.assertFalse(Seller.objects.legacy_keys().exists())
+        with mock.patch("invoicing_app.models.check_password", return_value=True) as check:
+            Seller.authenticate("Legacy!Key9")
+        self.assertEqual(check.call_count, 1)
+
+    @override_settings(SELLER_LEGACY_KEY_SCAN=False)
+    def test_legacy_report(self):
+        out = StringIO()
+        call_command("legacy_seller_keys", stdout=out)
+        self.assertIn("1 seller(s)", out.getvalue())
+        self.assertIn("SELLER_LEGACY_KEY_SCAN is off", out.getvalue())
+
+    def test_legacy_report_when_all_are_fingerprinted(self):
+        self.legacy.delete()
+        out = StringIO()
+        call_command("legacy_seller_keys", stdout=out)
+        self.assertIn("0 seller(s)", out.getvalue())
+        self.assertIn("can be turned off", out.getvalue())
+
+
+@override_settings(LOGIN_THROTTLE_RATES={"ip": (3, 60), "session": (2, 60)})
+class SellerLoginThrottleTests(TestCase):
+    def setUp(self):
+        throttle.get_cache().clear()
+        throttle.reset_stats()
+        self.room = make_room()
+
+    def login(self, key, ip="10.0.0.1"):
+        return self.client.post("/seller_authenticate/", {"secret_key": key}, REMOTE_ADDR=ip)
+
+    def test_rejects_before_hashing_once_over_limit(self):
+        for _ in range(3):
+            self.assertEqual(self.login("wrong").status_code, 401)
+
+        with mock.patch("invoicing_app.models.check_password") as check:
+            response = self.login("Str0ng!Key")
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response["Retry-After"]), 0)
+        check.assert_not_called()
+
+        # Other clients are unaffected
+        self.assertEqual(self.login("Str0ng!Key", ip="10.0.0.2").status_code, 200)
+
+        stats = throttle.stats()["seller_auth"]
+        self.assertEqual((stats["rejected"], stats["failed"]), (1, 3))
+
+    def test_room_hash_guesses_are_limited_per_session(self):
+        self.assertEqual(self.login("Str0ng!Key").status_code, 200)
+        for ip in ("10.0.0.3", "10.0.0.4"):
+            response = self.client.post("/seller_room_authenticate/", {"room_hash": "guess"}, REMOTE_ADDR=ip)
+            self.assertEqual(response.status_code, 401)
+
+        response = self.client.post(
+            "/seller_room_authenticate/", {"room_hash": self.room.room_hash}, REMOTE_ADDR="10.0.0.5"
+        )
+        self.assertEqual(response.status_code, 429)
+
+    def test_old_failures_slide_out_of_the_window(self):
+        with mock.patch("invoicing_app.throttle.time.time", return_value=120.0):
+            for _ in range(3):
+                self.login("wrong")
+            self.assertEqual(self.login("wrong").status_code, 429)
+        # Halfway through the next window the previous bucket weighs 1.5 failures
+        with mock.patch("invoicing_app.throttle.time.time", return_value=210.0):
+            self.assertEqual(self.login("wrong").status_code, 401)
+
+    @override_settings(LOGIN_THROTTLE_IP_HEADER="HTTP_X_REAL_IP")
+    def test_clients_behind_the_proxy_are_limited_separately(self):
+        for _ in range(3):
+            self.client.post("/seller_authenticate/", {"secret_key": "wrong"}, HTTP_X_REAL_IP="203.0.113.1")
+
+        other = self.client_class()
+        response = other.post("/seller_authenticate/", {"secret_key": "Str0ng!Key"}, HTTP_X_REAL_IP="203.0.113.2")
+        self.assertEqual(response.status_code, 200)
+
+    def test_successful_logins_do_not_use_up_the_limit(self):
+        for _ in range(5):
+            self.assertEqual(self.login("Str0ng!Key", ip="10.0.0.9").status_code, 200)
+        self.assertEqual(throttle.stats()["seller_auth"]["failed"], 0)
+
+    def test_concurrent_burst_is_bounded(self):
+        started = threading.Barrier(8)
+        calls = []
+
+        def slow_authenticate(raw_key):
+            calls.append(raw_key)
+            time.sleep(0.2)
+            return None
+
+        def login():
+            started.wait()
+            return self.client_class().post("/seller_authenticate/", {"secret_key": "wrong"}).status_code
+
+        with mock.patch("invoicing_app.models.Seller.authenticate", side_effect=slow_authenticate):
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                statuses = sorted(executor.map(lambda _: login(), range(8)))
+
+        self.assertEqual(statuses, [401] * 3 + [429] * 5)
+        self.assertEqual(len(calls), 3)
+
+
+class InvoiceConcurrencyTests(TestCase):
+    def approve(self, room, **extra):
+        buyer_hash = room.buyer.buyer_hash
+        return self.client.post(
+            f"/api/buyer/{room.room_hash}/approve/", {"buyer_hash": buyer_hash, **extra}, content_type="application/json"
+        )
+
+    def test_transition_is_a_single_conditional_update(self):
+        room = make_room()
+        first = Invoice.objects.get(room=room)
+        second = Invoice.objects.get(room=room)
+
+        with self.assertNumQueries(1):
+            self.assertTrue(first.transition(["draft"], "pending", "buyer_approved_at"))
+        self.assertFalse(second.transition(["draft"], "pending", "buyer_approved_at"))
+
+        invoice = Invoice.objects.get(room=room)
+        self.assertEqual((invoice.status, invoice.version), ("pending", 2))
+        self.assertEqual(invoice.updated_at, first.updated_at)
+        self.assertIsNotNone(invoice.buyer_approved_at)
+
+    def test_approving_a_stale_version_conflicts(self):
+        room = make_room()
+        version = room.invoice.version
+        response = self.client.put(
+            f"/api/seller/{room.room_hash}/edit-single-invoice/", {"quantity": 3}, content_type="application/json",
+            **seller_headers(room),
+        )
+        self.assertEqual(response.json()["invoice"]["version"], version + 1)
+
+        response = self.approve(room, version=version)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Invoice.objects.get(room=room).status, "draft")
+
+        response = self.approve(room, version=version + 1)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["invoice"]["status"], "pending")
+
+    def test_stale_edit_conflicts_and_leaves_the_row_alone(self):
+        room = make_room()
+        url = f"/api/seller/{room.room_hash}/edit-single-invoice/"
+        self.client.put(url, {"quantity": 3, "version": 1}, content_type="application/json", **seller_headers(room))
+
+        response = self.client.put(
+            url, {"quantity": 9, "version": 1}, content_type="application/json", **seller_headers(room)
+        )
+        self.assertEqual(response.status_code, 409)
+        invoice = Invoice.objects.get(room=room)
+        self.assertEqual((invoice.quantity, invoice.version), (3, 2))
+
+    def test_invalid_version(self):
+        room = make_room()
+        self.assertEqual(self.approve(room, version="x").status_code, 400)
+
+
+class InvoiceStateMachineTests(TestCase):
+    def post(self, room, action, **data):
+        return self.client.post(f"/api/buyer/{room.room_hash}/{action}/", data, content_type="application/json")
+
+    def test_transitions_use_declared_statuses(self):
+        statuses = {value for value, _ in Invoice.STATUS_CHOICES}
+        actions = {value for value, _ in NegotiationHistory.ACTION_CHOICES}
+        for spec in state_machine.TRANSITIONS.values():
+            self.assertLessEqual(set(spec.sources) | {spec.target}, statuses)
+            self.assertIn(spec.action, actions)
+
+    def test_apply_is_one_update_and_one_insert(self):
+        room = make_room(history=0)
+        invoice = room.invoice
+        with CaptureQueriesContext(connection) as queries:
+            entry = state_machine.apply(invoice, "approve")
+        statements = [q["sql"].split()[0] for q in queries if not q["sql"].startswith(("SAVEPOINT", "RELEASE"))]
+        self.assertEqual(statements, ["UPDATE", "INSERT"])
+        self.assertEqual((entry.action, entry.actor), ("approved", "buyer"))
+        self.assertEqual(Invoice.objects.get(pk=invoice.pk).status, "pending")
+
+        with self.assertNumQueries(0), self.assertRaises(state_machine.InvalidTransition):
+            state_machine.apply(invoice, "confirm_payment")
+
+    def test_full_lifecycle(self):
+        room = make_room(history=0)
+        buyer_hash = room.buyer.buyer_hash
+        self.assertEqual(self.post(room, "approve", buyer_hash=buyer_hash).status_code, 200)
+        self.assertEqual(self.post(room, "mark-paid", buyer_hash=buyer_hash).status_code, 200)
+        response = self.client.post(f"/api/seller/{room.room_hash}/confirm-payment/", **seller_headers(room))
+        self.assertEqual(response.json()["invoice_status"], "finalized")
+
+        invoice = Invoice.objects.get(room=room)
+        self.assertTrue(all([invoice.buyer_approved_at, invoice.buyer_paid_at, invoice.seller_confirmed_at]))
+        self.assertEqual(
+            list(room.history.order_by("id").values_list("action", flat=True)), ["approved", "paid", "confirmed"]
+        )
+
+        response = self.client.put(
+            f"/api/seller/{room.room_hash}/edit-single-invoice/", {"quantity": 5}, content_type="application/json",
+            **seller_headers(room),
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_approved_invoice_cannot_be_edited(self):
+        room = make_room()
+        state_machine.apply(room.invoice, "approve")
+        response = self.client.put(
+            f"/api/seller/{room.room_hash}/edit-single-invoice/", {"quantity": 5}, content_type="application/json",
+            **seller_headers(room),
+        )
+        self.assertEqual(response.status_code, 400)
+        invoice = Invoice.objects.get(room=room)
+        self.assertEqual((invoice.status, invoice.quantity), ("pending", 1))
+
+    def test_edit_fields_are_written_by_the_guarded_update(self):
+        room = make_room(history=0)
+        stale = Invoice.objects.get(room=room)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.put(
+                f"/api/seller/{room.room_hash}/edit-single-invoice/", {"quantity": 5},
+                content_type="application/json", **seller_headers(room),
+            )
+        self.assertEqual(response.status_code, 200)
+        invoice_updates = [q["sql"] for q in queries if q["sql"].startswith('UPDATE "invoicing_app_invoice"')]
+        self.assertEqual(len(invoice_updates), 1)
+        self.assertIn('"quantity" = 5', invoice_updates[0])
+        self.assertIn(f'"invoicing_app_invoice"."version" = {stale.version}', invoice_updates[0])
+        self.assertEqual(Invoice.objects.get(room=room).line_total, Decimal("50.00"))
+
+        # A writer still holding the old version changes nothing
+        self.assertEqual(apply_seller_edit(stale, {"description": "stale"}).status_code, 409)
+        self.assertEqual(Invoice.objects.get(room=room).description, "Single item")
+
+    def test_disapprove_requires_a_draft(self):
+        room = make_room()
+        buyer_hash = room.buyer.buyer_hash
+        self.post(room, "approve", buyer_hash=buyer_hash)
+        response = self.post(room, "disapprove", buyer_hash=buyer_hash)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Invoice.objects.get(room=room).status, "pending")
+
+    def test_mark_paid_checks_the_buyer(self):
+        room = make_room()
+        state_machine.apply(room.invoice, "approve")
+        self.assertEqual(self.post(room, "mark-paid").status_code, 403)
+        self.assertEqual(Invoice.objects.get(room=room).status, "pending")
+
+
+class InvoiceItemReconciliationTests(TestCase):
+    def test_only_changed_items_are_rewritten(self):
+        room = make_room(items=3)
+        first, second, third = room.invoice.items.order_by("id")
+        payload = {
+            "items": [
+                {"id": first.id, "product_name": first.product_name, "quantity": 2, "unit_price": "5.00"},
+                {"id": second.id, "product_name": second.product_name, "quantity": 4, "unit_price": "5.00"},
+                {"product_name": "New", "quantity": 1, "unit_price": "7.50"},
+            ]
+        }
+
+        response = self.client.put(
+            f"/api/seller/{room.room_hash}/update-invoice/", payload, content_type="application/json",
+            **seller_headers(room),
+        )
+        self.assertEqual(response.status_code, 200)
+
+        items = {item.product_name: item for item in room.invoice.items.all()}
+        self.assertEqual(set(items), {first.product_name, second.product_name, "New"})
+        self.assertEqual(items[first.product_name].id, first.id)
+        self.assertEqual(items[second.product_name].line_total, Decimal("20.00"))
+        self.assertEqual(items["New"].line_total, Decimal("7.50"))
+
+        actions = sorted(MultiItemNegotiationHistory.objects.filter(room=room).values_list("action", flat=True))
+        self.assertEqual(actions, ["added_item", "edited_item", "removed_item"])
+        self.assertEqual(
+            MultiItemNegotiationHistory.objects.get(action="edited_item").item_id, second.id
+        )
+        self.assertEqual(Decimal(str(response.json()["invoice"]["total_amount"])), Decimal("37.50"))
+
+    def test_partial_new_item_is_a_validation_error(self):
+        room = make_room(items=2)
+        payload = {"items": [{"product_name": "New", "quantity": 1}]}
+        response = self.client.put(
+            f"/api/seller/{room.room_hash}/update-invoice/", payload, content_type="application/json",
+            **seller_headers(room),
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("unit_price", response.json()["items"]["0"])
+
+        invoice = Invoice.objects.get(room=room)
+        self.assertEqual((invoice.items.count(), invoice.version, invoice.status), (2, 1, "draft"))
+
+
+# Cookie sessions keep the session write out of the query counts
+@override_settings(SESSION_ENGINE="django.contrib.sessions.backends.signed_cookies")
+class CreateInvoiceTests(TestCase):
+    def test_creation_writes_once_and_reads_nothing_back(self):
+        payload = {
+            "seller_fullname": "Seller",
+            "seller_secret_key": "Str0ng!Key",
+            "seller_secret_key_confirm": "Str0ng!Key",
+            "invoice_date": "2025-01-01",
+            "description": "Logo design",
+            "quantity": 2,
+            "unit_price": "150.00",
+            "payment_method": "cash",
+        }
+        # savepoint + room, seller, invoice and history inserts + release + buyer lookup
+        with self.assertNumQueries(7):
+            response = self.client.post("/api/invoice/create/", payload, content_type="application/json")
+
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        room = Room.objects.get(room_hash=data["room_hash"])
+        self.assertEqual(data["seller_hash"], room.seller_hash)
+        self.assertTrue(room.seller.check_secret_key("Str0ng!Key"))
+        self.assertIsNone(data["buyer"])
+        self.assertEqual([entry["action"] for entry in data["history"]], ["created"])
+        self.assertEqual(Decimal(str(data["invoice"]["total_amount"])), Decimal("300.00"))
+
+
+class SellerCapabilityTests(TestCase):
+    def setUp(self):
+        throttle.get_cache().clear()
+        self.room = make_room()
+        self.url = f"/api/seller/{self.room.room_hash}/edit-single-invoice/"
+
+    def edit(self, **headers):
+        return self.client.put(self.url, {"quantity": 4}, content_type="application/json", **headers)
+
+    def test_seller_views_require_a_token_for_the_room(self):
+        other = make_room()
+        self.assertEqual(self.edit().status_code, 403)
+        self.assertEqual(self.edit(HTTP_X_SELLER_TOKEN="forged").status_code, 403)
+        self.assertEqual(self.edit(**seller_headers(other)).status_code, 403)
+        self.assertEqual(Invoice.objects.get(room=self.room).quantity, 1)
+
+        with mock.patch("invoicing_app.models.check_password") as check, self.assertNumQueries(0):
+            self.assertEqual(
+                self.client.post(f"/api/seller/{self.room.room_hash}/confirm-payment/").status_code, 403
+            )
+        check.assert_not_called()
+        self.assertEqual(self.edit(**seller_headers(self.room)).status_code, 200)
+
+    @override_settings(SELLER_TOKEN_MAX_AGE=60)
+    def test_tokens_expire(self):
+        with mock.patch("django.core.signing.time.time", return_value=time.time() - 120):
+            token = issue_seller_token(self.room.room_hash)
+        self.assertEqual(self.edit(HTTP_X_SELLER_TOKEN=token).status_code, 403)
+
+    def test_authentication_issues_a_token(self):
+        self.client.post("/seller_authenticate/", {"secret_key": "Str0ng!Key"})
+        response = self.client.post("/seller_room_authenticate/", {"room_hash": self.room.room_hash})
+        token = response.json()["seller_token"]
+        self.assertEqual(self.edit(HTTP_X_SELLER_TOKEN=token).status_code, 200)
+
+        page = self.client.get(f"/seller_room/{self.room.room_hash}/")
+        self.assertTrue(page.context["seller_token"])
+        self.assertFalse(self.client_class().get(f"/seller_room/{self.room.room_hash}/").context["seller_token"])
+
+    @override_settings(SELLER_TOKEN_MAX_AGE=60)
+    def test_reloading_the_room_page_renews_an_expired_token(self):
+        self.client.post("/seller_authenticate/", {"secret_key": "Str0ng!Key"})
+        with mock.patch("django.core.signing.time.time", return_value=time.time() - 120):
+            token = self.client.post(
+                "/seller_room_authenticate/", {"room_hash": self.room.room_hash}
+            ).json()["seller_token"]
+        self.assertEqual(self.edit(HTTP_X_SELLER_TOKEN=token).status_code, 403)
+
+        token = self.client.get(f"/seller_room/{self.room.room_hash}/").context["seller_token"]
+        self.assertEqual(self.edit(HTTP_X_SELLER_TOKEN=token).status_code, 200)
+
+
+class BuyerAuthorizationTests(TestCase):
+    def setUp(self):
+        self.room = make_room(history=0)
+        self.buyer_hash = self.room.buyer.buyer_hash
+
+    def test_room_and_buyer_load_in_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            room = load_buyer_room(self.room.room_hash, self.buyer_hash)
+            self.assertEqual((room.buyer.pk, room.invoice.pk), (self.room.buyer.pk, self.room.invoice.pk))
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"buyer_hash" =', queries[0]["sql"])
+
+        self.assertIsNone(load_buyer_room(self.room.room_hash, self.buyer_hash[:-1]))
+        self.assertIsNone(load_buyer_room(make_room().room_hash, self.buyer_hash))
+        with self.assertNumQueries(0):
+            self.assertIsNone(load_buyer_room(self.room.room_hash, ["not", "a", "hash"]))
+
+    def test_buyer_actions_reject_wrong_or_missing_hash(self):
+        url = f"/api/buyer/{self.room.room_hash}/approve/"
+        for data in ({}, {"buyer_hash": "wrong"}):
+            self.assertEqual(self.client.post(url, data, content_type="application/json").status_code, 403)
+        response = self.client.post(
+            "/api/buyer/missing/approve/", {"buyer_hash": self.buyer_hash}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(Invoice.objects.get(room=self.room).status, "draft")
+
+        response = self.client.post(url, {"buyer_hash": self.buyer_hash}, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+
+    def test_buyer_room_page_uses_the_same_check(self):
+        page = self.client.get(f"/buyer_invoice_room/{self.room.room_hash}/wrong/")
+        self.assertTrue(page.context["unauthorized"])
+        page = self.client.get(f"/buyer_invoice_room/{self.room.room_hash}/{self.buyer_hash}/")
+        self.assertFalse(page.context["unauthorized"])
+
+
+# Cookie sessions keep the session write out of the query counts
+@override_settings(SESSION_ENGINE="django.contrib.sessions.backends.signed_cookies")
+class CreateMultipleInvoiceTests(TestCase):
+    def form(self, rows):
+        data = {
+            "seller_fullname": "Seller",
+            "seller_secret_key": "Str0ng!Key",
+            "invoice_date": "2025-01-01",
+            "payment_method": "cash",
+            "items-count": str(len(rows)),
+        }
+        for i, (name, quantity, price) in enumerate(rows):
+            data.update({
+                f"items-{i}-product_name": name,
+                f"items-{i}-quantity": quantity,
+                f"items-{i}-unit_price": price,
+            })
+        return data
+
+    def test_items_are_created_in_constant_queries(self):
+        for count in (2, 50):
+            rows = [(f"Item {i}", "2", "3.50") for i in range(count)]
+            with self.assertNumQueries(7):
+                response = self.client.post("/invoice/create/", self.form(rows))
+            self.assertEqual(response.status_code, 302)
+
+        invoice = Invoice.objects.get(room__room_hash=response.url.strip("/").split("/")[-1])
+        self.assertEqual(invoice.items.count(), 50)
+        self.assertEqual(invoice.total_amount(), Decimal("350.00"))
+
+    def test_bad_row_creates_nothing(self):
+        response = self.client.post("/invoice/create/", self.form([("Good", "1", "5"), ("Bad", "x", "5")]))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Room.objects.exists())
+
+    def test_non_finite_prices_are_rejected(self):
+        for price in ("NaN", "-NaN", "sNaN", "Infinity", "-inf"):
+            response = self.client.post("/invoice/create/", self.form([("Item", "1", price)]))
+            self.assertEqual(response.status_code, 400, price)
+            self.assertContains(response, "must be numbers", status_code=400)
+        self.assertFalse(Room.objects.exists())
+
+    @override_settings(MAX_INVOICE_ITEMS=3)
+    def test_items_count_is_capped(self):
+        response = self.client.post("/invoice/create/", self.form([("Item", "1", "1")] * 4))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Room.objects.exists())
@@ -0,0 +1,133 @@
+"""
+Failed-attempt throttling for the seller authentication views.
+
+Attempts are counted per client IP and per session in the Django cache
+using a sliding window. The window is approximated from the current and
+previous fixed buckets. Views call ``attempt()`` before doing any password
+work: it counts the attempt with an atomic ``incr`` and rejects on the
+result, so a burst of concurrent requests cannot all pass before one of
+them is recorded. A successful attempt is handed back with ``release()``,
+so only failures use up the limit. Limits come from LOGIN_THROTTLE_RATES
+as ``{identity: (max_failures, window_seconds)}``.
+"""
+import math
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+
+DEFAULT_RATES = {
+    'ip': (20, 300),
+    'session': (5, 300),
+}
+
+_stats_lock = threading.Lock()
+_stats = Counter()
+
+
+def get_cache():
+    return caches[getattr(settings, 'LOGIN_THROTTLE_CACHE', 'default')]
+
+
+def _rates():
+    return getattr(settings, 'LOGIN_THROTTLE_RATES', DEFAULT_RATES)
+
+
+def client_ip(request):
+    header = getattr(settings, 'LOGIN_THROTTLE_IP_HEADER', None)
+    if header and request.META.get(header):
+        return request.META[header].split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _identities(request):
+    identities = {'ip': client_ip(request)}
+    if request.session.session_key:
+        identities['session'] = request.session.session_key
+    return {kind: value for kind, value in identities.items() if kind in _rates() and value}
+
+
+def _bucket_key(scope, kind, value, bucket):
+    return f'login_throttle:{scope}:{kind}:{value}:{bucket}'
+
+
+def _record_stat(scope, outcome):
+    with _stats_lock:
+        _stats[(scope, outcome)] += 1
+
+
+def _incr(cache, key, window):
+    # Buckets live for two windows: as current, then as previous
+    cache.add(key, 0, window * 2)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, window * 2)
+        return 1
+
+
+def _decr(cache, keys):
+    for key in keys:
+        try:
+            cache.decr(key)
+        except ValueError:
+            pass
+
+
+def attempt(request, scope):
+    """Count an attempt by ``request``; return the seconds to wait if it is over a limit, else None"""
+    cache = get_cache()
+    now = time.time()
+    rates = _rates()
+    windows = []
+    for kind, value in _identities(request).items():
+        limit, window = rates[kind]
+        bucket = int(now // window)
+        current = _bucket_key(scope, kind, value, bucket)
+        windows.append((
+            limit, window, now % window / window,
+            current, _incr(cache, current, window), _bucket_key(scope, kind, value, bucket - 1),
+        ))
+
+    counted = [current for *_, current, _, _ in windows]
+    previous_counts = cache.get_many([previous for *_, previous in windows])
+    for limit, window, elapsed, _, count, previous in windows:
+        if previous_counts.get(previous, 0) * (1 - elapsed) + count > limit:
+            # Rejected attempts do no password work, so they are not counted
+            _decr(cache, counted)
+            _record_stat(scope, 'rejected')
+            return max(1, math.ceil(window * (1 - elapsed)))
+
+    request._login_throttle_keys = {**getattr(request, '_login_throttle_keys', {}), scope: counted}
+    _record_stat(scope, 'allowed')
+    return None
+
+
+def release(request, scope):
+    """Give back the attempt counted by ``attempt()`` after it succeeded"""
+    _decr(get_cache(), getattr(request, '_login_throttle_keys', {}).pop(scope, []))
+    _record_stat(scope, 'released')
+
+
+def stats():
+    with _stats_lock:
+        scopes = {scope for scope, _ in _stats}
+        result = {}
+        for scope in sorted(scopes):
+            allowed, rejected = _stats[(scope, 'allowed')], _stats[(scope, 'rejected')]
+            checked = allowed + rejected
+            result[scope] = {
+                'allowed': allowed,
+                'rejected': rejected,
+                # Attempts not released are failures, or still in progress
+                'failed': allowed - _stats[(scope, 'released')],
+                'rejected_ratio': rejected / checked if checked else 0.0,
+            }
+        return result
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
@@ -16,6 +16,8 @@ urlpatterns = [
     
     path('api/invoice/create/', views.create_invoice, name='create_invoice'),
     path('api/room/<str:room_hash>/', views.get_room, name='get_room'),
+    path('api/room/<str:room_hash>/exists/', views.room_exists, name='room_exists'),
+    path('api/room/<str:room_hash>/history/', views.room_history, name='room_history'),
     path('api/room/<str:room_hash>/start-negotiation/', views.seller_start_negotiation, name='start_negotiation'),
     
     path('api/seller/<str:room_hash>/edit-invoice/', views.seller_edit_invoice, name='seller_edit_invoice'),
@@ -42,6 +44,8 @@ urlpatterns = [
     path('api/invoice/update/<str:room_hash>/', views.update_invoice, name='update_invoice'),    
     
     path('proof_transaction/<str:room_hash>/pdf/', views.proof_of_transaction_pdf, name='proof_of_transaction_pdf'),
+    path('api/proofs/export/', views.export_proofs_zip, name='export_proofs_zip'),
+    path('api/metrics/cache/', views.cache_metrics, name='cache_metrics'),
     
     path('invoice/<str:room_hash>/encrypt/', 
          encrypted_data_views.create_encrypted_invoice, 
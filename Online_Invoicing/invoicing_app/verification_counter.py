@@ -0,0 +1,172 @@
+"""
+Write-behind verification counters for EncryptedInvoiceRecord.
+
+With VERIFICATION_WRITE_BEHIND on, a successful decrypt only increments a
+counter in the VERIFICATION_COUNTER_CACHE cache, which must be shared and
+must not cull (settings.py enables it only with CACHE_REDIS_URL). Pending
+increments are added to the row with ``F('verification_count') + n``.
+
+Each process runs a daemon thread that flushes the records it touched every
+VERIFICATION_FLUSH_INTERVAL seconds, and flushes once more at interpreter
+exit. The ``flush_verification_counts`` command flushes every record, which
+also picks up counts left by workers that died. Reported counts are the
+stored count plus what is still pending, so they stay approximately current
+between flushes.
+"""
+import atexit
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import EncryptedInvoiceRecord
+
+logger = logging.getLogger(__name__)
+
+FLUSH_LOCK_KEY = "verification:flush-lock"
+
+_lock = threading.Lock()
+_dirty = set()
+_flusher = None
+
+
+def enabled():
+    return getattr(settings, "VERIFICATION_WRITE_BEHIND", False)
+
+
+def get_cache():
+    return caches[getattr(settings, "VERIFICATION_COUNTER_CACHE", "default")]
+
+
+def _count_key(pk):
+    return f"verification:count:{pk}"
+
+
+def _seen_key(pk):
+    return f"verification:seen:{pk}"
+
+
+def record(encrypted_record):
+    """Count one verification of ``encrypted_record`` and update the instance to the current totals"""
+    if not enabled():
+        encrypted_record.increment_verification()
+        return
+
+    cache = get_cache()
+    pk = encrypted_record.pk
+    now = timezone.now()
+
+    cache.add(_count_key(pk), 0, None)
+    try:
+        pending = cache.incr(_count_key(pk))
+    except ValueError:
+        cache.set(_count_key(pk), 1, None)
+        pending = 1
+    cache.set(_seen_key(pk), now, None)
+
+    encrypted_record.verification_count += pending
+    encrypted_record.last_verified_at = now
+
+    with _lock:
+        _dirty.add(pk)
+    _start_flusher()
+
+
+def _start_flusher():
+    global _flusher
+    with _lock:
+        if _flusher is not None:
+            return
+        _flusher = threading.Thread(target=_flush_periodically, name="verification-flush", daemon=True)
+        _flusher.start()
+    atexit.register(flush_dirty)
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(getattr(settings, "VERIFICATION_FLUSH_INTERVAL", 30))
+        try:
+            flush_dirty()
+        except Exception:
+            logger.exception("Flushing verification counts failed")
+        finally:
+            close_old_connections()
+
+
+def flush_dirty():
+    """Flush the records this process counted since the last flush"""
+    with _lock:
+        pks = set(_dirty)
+        _dirty.clear()
+    if not pks:
+        return 0
+    flushed = flush(pks)
+    if flushed is None:
+        # Another worker is flushing; keep ours for the next interval
+        with _lock:
+            _dirty.update(pks)
+    return flushed
+
+
+def current(encrypted_record):
+    """Return ``(verification_count, last_verified_at)`` including pending increments"""
+    if not enabled():
+        return encrypted_record.verification_count, encrypted_record.last_verified_at
+    cache = get_cache()
+    pk = encrypted_record.pk
+    values = cache.get_many([_count_key(pk), _seen_key(pk)])
+    return (
+        encrypted_record.verification_count + (values.get(_count_key(pk)) or 0),
+        values.get(_seen_key(pk)) or encrypted_record.last_verified_at,
+    )
+
+
+def flush(pks):
+    """Write pending increments for ``pks`` to the database.
+
+    Returns the number of records updated, or None if another flush holds
+    the lock.
+    """
+    cache = get_cache()
+    if not cache.add(FLUSH_LOCK_KEY, 1, 60):
+        return None
+    try:
+        count_keys = {_count_key(pk): pk for pk in pks}
+        pending = {count_keys[key]: n for key, n in cache.get_many(list(count_keys)).items() if n}
+        if not pending:
+            return 0
+        seen = cache.get_many([_seen_key(pk) for pk in pending])
+
+        with transaction.atomic():
+            for pk, n in pending.items():
+                values = {"verification_count": F("verification_count") + n}
+                if seen.get(_seen_key(pk)):
+                    values["last_verified_at"] = seen[_seen_key(pk)]
+                EncryptedInvoiceRecord.objects.filter(pk=pk).update(**values)
+
+        # Subtract only what was written; increments made meanwhile stay pending
+        for pk, n in pending.items():
+            cache.decr(_count_key(pk), n)
+        return len(pending)
+    finally:
+        cache.delete(FLUSH_LOCK_KEY)
+
+
+def flush_all(batch_size=500):
+    """Flush pending increments of every record; returns the number of records updated"""
+    flushed = 0
+    pks = EncryptedInvoiceRecord.objects.values_list("pk", flat=True).order_by("pk")
+    batch = []
+    for pk in pks.iterator(chunk_size=batch_size):
+        batch.append(pk)
+        if len(batch) == batch_size:
+            flushed += flush(batch) or 0
+            batch = []
+    if batch:
+        flushed += flush(batch) or 0
+    return flushed
@@ -1,13 +1,16 @@
 from rest_framework import status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django.http import HttpResponse
-from .models import Room, Seller, Buyer, Invoice, NegotiationHistory
+from .models import Room, Seller, Buyer, Invoice, NegotiationHistory, history_embed_limit
 from .serializers import (
     RoomDetailSerializer, CreateInvoiceSerializer, 
-    BuyerJoinSerializer, InvoiceSerializer, SingleInvoiceSerializer
+    BuyerJoinSerializer, InvoiceSerializer, SingleInvoiceSerializer,
+    ProofExportSerializer, NegotiationHistorySerializer, MultiItemNegotiationHistorySerializer
 )
 
 import uuid, secrets, hashlib
@@ -20,8 +23,21 @@ from django.shortcuts import redirect, render
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 
-from django.http import HttpResponse
-from .reports.proof_transactions import build_proof_transaction_pdf
+from django.http import HttpResponse, FileResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from .invoice_services import apply_seller_edit, create_room_with_invoice, expected_version, run_transition
+from .history_pages import InvalidCursor, history_page, page_size
+from . import room_cache, throttle
+from .capabilities import (
+    buyer_required, grant_seller_room, issue_seller_token, load_buyer_room, seller_token_required,
+    session_seller_token,
+)
+from .encryption_utils import get_key_cache
+from .realtime import publish_room_state
+from .reports import pdf_cache, prerender
+from .reports.export import stream_proofs_zip
+from .reports.proof_transactions import base_url_for
 from django.contrib.auth.hashers import check_password, make_password
 
 from decimal import Decimal, InvalidOperation
@@ -43,55 +59,124 @@ def create_invoice(request):
     if serializer.is_valid():
         data = serializer.validated_data
 
-        room = Room.objects.create()
-
-        seller = Seller(
-            room=room,
-            fullname=data['seller_fullname'],
-            email=data.get('seller_email', ''),
-            phone=data.get('seller_phone', ''),
-            social_media=data.get('seller_social_media', ''),
-            profile_picture=data.get('seller_profile_picture')
-        )
-        seller.set_secret_key(data['seller_secret_key'])
-        seller.save()
-
-        invoice = Invoice.objects.create(
-            room=room,
-            invoice_date=data['invoice_date'],
-            due_date=data.get('due_date'),
-            description=data['description'],
-            quantity=data['quantity'],
-            unit_price=data['unit_price'],
-            payment_method=data['payment_method'],
-            status='draft'
-        )
-
-        NegotiationHistory.objects.create(
-            room=room,
-            action='created',
-            actor='seller',
-            notes='Invoice created'
+        room = create_room_with_invoice(
+            seller_data={
+                'fullname': data['seller_fullname'],
+                'email': data.get('seller_email', ''),
+                'phone': data.get('seller_phone', ''),
+                'social_media': data.get('seller_social_media', ''),
+                'profile_picture': data.get('seller_profile_picture'),
+            },
+            raw_secret_key=data['seller_secret_key'],
+            invoice_data={
+                'invoice_date': data['invoice_date'],
+                'due_date': data.get('due_date'),
+                'description': data['description'],
+                'quantity': data['quantity'],
+                'unit_price': data['unit_price'],
+                'payment_method': data['payment_method'],
+                'status': 'draft',
+            },
         )
 
+        grant_seller_room(request, room.room_hash)
         room_serializer = RoomDetailSerializer(room, context={'request': request})
         return Response({
             **room_serializer.data,
             "message": "Invoice created successfully",
             "room_hash": room.room_hash,   
             "seller_hash": room.seller_hash,  
+            "seller_token": issue_seller_token(room.room_hash),
         }, status=status.HTTP_201_CREATED)
 
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+def _room_validators(updated_at, invoice_updated_at, latest_history_id):
+    """ETag and Last-Modified timestamp of a room's serialized state"""
+    stamps = [stamp for stamp in (updated_at, invoice_updated_at) if stamp]
+    state = f"{updated_at.isoformat()}|{invoice_updated_at.isoformat() if invoice_updated_at else ''}|{latest_history_id}"
+    etag = f'"{hashlib.md5(state.encode(), usedforsecurity=False).hexdigest()}"'
+    return etag, int(max(stamps).timestamp())
+
 @api_view(['GET'])
 def get_room(request, room_hash):
-    room = get_object_or_404(Room, room_hash=room_hash)
-    serializer = RoomDetailSerializer(room, context={'request': request})
-    return Response(serializer.data)
+    version, cached = room_cache.lookup(room_hash)
+    if cached is not None:
+        etag, last_modified, data = cached
+    else:
+        # Clients holding the current copy are answered from one small query
+        if request.headers.get('If-None-Match') or request.headers.get('If-Modified-Since'):
+            markers = Room.objects.filter(room_hash=room_hash).state_markers().first()
+            if markers is not None:
+                etag, last_modified = _room_validators(**markers)
+                not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+                if not_modified is not None:
+                    return not_modified
+
+        room = get_object_or_404(Room.objects.with_details().with_latest_history(), room_hash=room_hash)
+        invoice = getattr(room, 'invoice', None)
+        etag, last_modified = _room_validators(
+            room.updated_at, invoice.updated_at if invoice else None, room.latest_history_id
+        )
+        data = RoomDetailSerializer(room, context={'request': request}).data
+        room_cache.store(room_hash, version, (etag, last_modified, data))
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
+
+    response = Response(data)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Let browsers keep the copy but revalidate it on every refetch
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+@api_view(['GET', 'HEAD'])
+def room_exists(request, room_hash):
+    """Whether a room exists, without serializing it.
+
+    One indexed query on room_hash; HEAD answers with the status code alone.
+    """
+    room = Room.objects.filter(room_hash=room_hash).values('is_buyer_assigned', 'invoice__status').first()
+    if room is None:
+        return Response({'exists': False}, status=status.HTTP_404_NOT_FOUND)
+    return Response({
+        'exists': True,
+        'room_hash': room_hash,
+        'is_buyer_assigned': room['is_buyer_assigned'],
+        'invoice_status': room['invoice__status'],
+    })
+
+@api_view(['GET'])
+def room_history(request, room_hash):
+    """Older history entries, newest first, one keyset page at a time.
+
+    ``?source=multi`` pages the multi-item history instead of the invoice
+    history; ``cursor`` is the ``next_cursor`` of the previous page.
+    """
+    room = get_object_or_404(Room.objects.only('id'), room_hash=room_hash)
+    if request.query_params.get('source') == 'multi':
+        queryset, serializer_class = room.multi_item_history.all(), MultiItemNegotiationHistorySerializer
+    else:
+        queryset, serializer_class = room.history.all(), NegotiationHistorySerializer
+
+    try:
+        entries, next_cursor = history_page(
+            queryset,
+            cursor=request.query_params.get('cursor'),
+            size=page_size(request.query_params.get('limit')),
+        )
+    except InvalidCursor:
+        return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        'results': serializer_class(entries, many=True).data,
+        'next_cursor': next_cursor,
+    })
 
 def seller_room_view(request, room_hash):
-    room = get_object_or_404(Room, room_hash=room_hash)
+    room = get_object_or_404(Room.objects.with_parties(), room_hash=room_hash)
     invoice_status = None
 
     if room.invoice:
@@ -103,55 +188,117 @@ def seller_room_view(request, room_hash):
         'invoice_status': invoice_status,
         'invoice': room.invoice,
         'is_buyer_assigned': room.is_buyer_assigned,
+        'seller_token': session_seller_token(request, room_hash) or '',
     })
 
 @api_view(['POST'])
+@seller_token_required
 def seller_start_negotiation(request, room_hash):
-    room = get_object_or_404(Room, room_hash=room_hash)
+    room = get_object_or_404(Room.objects.with_parties(), room_hash=room_hash)
     
     if not hasattr(room, 'seller'):
         return Response({'error': 'Seller not found'}, status=status.HTTP_404_NOT_FOUND)
     
-    invoice = room.invoice
-    invoice.status = 'negotiating'
-    invoice.save()
-    
-    NegotiationHistory.objects.create(
-        room=room,
-        action='edited',
-        actor='seller',
-        notes='Negotiation started'
-    )
-    
-    serializer = RoomDetailSerializer(room, context={'request': request})
+    error = run_transition(room.invoice, 'start_negotiation')
+    if error:
+        return error
+
+    serializer = RoomDetailSerializer(room.load_details(), context={'request': request})
+    room_cache.bump(room.room_hash)
+    publish_room_state(room.room_hash, 'room_update', serializer.data)
     return Response(serializer.data)
 
 from django.shortcuts import get_object_or_404, render
 from .models import Room, Buyer
 
 def buyer_room_view(request, room_hash):
-    room = get_object_or_404(Room, room_hash=room_hash)
+    room = get_object_or_404(Room.objects.with_parties(), room_hash=room_hash)
     return render(request, 'buyer_room.html', {
         'room_hash': room_hash
     })
 
 def proof_of_transaction_pdf(request, room_hash):
-    room = get_object_or_404(Room, room_hash=room_hash)
-    serializer = RoomDetailSerializer(room)
+    room = get_object_or_404(Room.objects.with_details(), room_hash=room_hash)
+    data = pdf_cache.room_proof_data(room)
+
+    base_url = base_url_for(request)
+    cached = pdf_cache.get_or_build(room.room_hash, data, base_url)
+    etag = f'"{cached.digest}"'
+    last_modified = int(cached.modified_at.timestamp())
 
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="Your_Proof_of_Transaction.pdf"'
+    not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if not_modified is not None:
+        return not_modified
 
-    data = serializer.data.copy()
-    data["room_id"] = str(room.id)  # 👈 add this
+    try:
+        pdf = cached.open()
+    except FileNotFoundError:
+        # Pruned by a concurrent render since the lookup: treat it as a miss
+        cached = pdf_cache.get_or_build(room.room_hash, data, base_url)
+        last_modified = int(cached.modified_at.timestamp())
+        pdf = cached.open()
+
+    response = FileResponse(
+        pdf,
+        content_type='application/pdf',
+        as_attachment=True,
+        filename="Your_Proof_of_Transaction.pdf",
+    )
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_metrics(request):
+    """Hit ratios of this worker's caches"""
+    return Response({
+        'room_state': room_cache.stats(),
+        'derived_keys': get_key_cache().stats(),
+        'login_throttle': throttle.stats(),
+    })
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def export_proofs_zip(request):
+    serializer = ProofExportSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    data = serializer.validated_data
+
+    rooms = Room.objects.filter(invoice__status='finalized')
+    if data.get('room_hashes'):
+        rooms = rooms.filter(room_hash__in=data['room_hashes'])
+    if data.get('confirmed_from'):
+        rooms = rooms.filter(invoice__seller_confirmed_at__date__gte=data['confirmed_from'])
+    if data.get('confirmed_to'):
+        rooms = rooms.filter(invoice__seller_confirmed_at__date__lte=data['confirmed_to'])
+
+    limit = getattr(settings, 'PROOF_EXPORT_MAX_ROOMS', 1000)
+    room_hashes = list(rooms.order_by('invoice__seller_confirmed_at').values_list('room_hash', flat=True)[:limit + 1])
+    if not room_hashes:
+        return Response({'error': 'No finalized invoices match'}, status=status.HTTP_404_NOT_FOUND)
+    if len(room_hashes) > limit:
+        return Response(
+            {'error': f'At most {limit} invoices can be exported at once'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
 
-    return build_proof_transaction_pdf(response, data, request=request)
+    response = StreamingHttpResponse(
+        stream_proofs_zip(
+            room_hashes,
+            base_url_for(request),
+            concurrency=getattr(settings, 'PROOF_EXPORT_WORKERS', 4),
+        ),
+        content_type='application/zip',
+    )
+    response['Content-Disposition'] = f'attachment; filename="Proofs_of_Transaction_{timezone.now():%Y%m%d}.zip"'
+    return response
 
 def buyer_invoice_room_view(request, room_hash, buyer_hash):
-    room = get_object_or_404(Room, room_hash=room_hash)
-    buyer = getattr(room, 'buyer', None)
+    room = load_buyer_room(room_hash, buyer_hash)
 
-    if not buyer or buyer.buyer_hash != buyer_hash:
+    if room is None:
         return render(request, 'buyer_invoice_room.html', {
             'room_hash': room_hash,
             'buyer_hash': buyer_hash,
@@ -170,7 +317,7 @@ def buyer_invoice_room_view(request, room_hash, buyer_hash):
     })
     
 def proof_transaction_view(request, room_hash):
-    room = get_object_or_404(Room, room_hash=room_hash)
+    room = get_object_or_404(Room.objects.with_details(), room_hash=room_hash)
     buyer = getattr(room, 'buyer', None)
 
     context = {
@@ -181,8 +328,8 @@ def proof_transaction_view(request, room_hash):
         'buyer': room.buyer,
         'invoice': room.invoice,
         'shareable_link': request.build_absolute_uri(),
-        'history': room.history.all(),
-        'multi_item_history': room.multi_item_history.all(),
+        'history': room.recent_history,
+        'multi_item_history': room.multi_item_history.order_by('-created_at', '-id')[:history_embed_limit()],
     }
     return render(request, 'proof_transaction.html', context)
 
@@ -195,7 +342,7 @@ def generate_buyer_room_hash():
 @csrf_exempt
 @api_view(['POST'])
 def buyer_join_room(request, room_hash):
-    room = get_object_or_404(Room, room_hash=room_hash)
+    room = get_object_or_404(Room.objects.with_parties(), room_hash=room_hash)
 
     if room.is_buyer_assigned:
         return Response(
@@ -220,7 +367,9 @@ def buyer_join_room(request, room_hash):
         room.is_buyer_assigned = True
         room.save()
 
-        room_serializer = RoomDetailSerializer(room, context={'request': request})
+        room_serializer = RoomDetailSerializer(room.load_details(), context={'request': request})
+        room_cache.bump(room.room_hash)
+        publish_room_state(room.room_hash, 'buyer_joined', room_serializer.data)
 
         return Response({
             'room': room_serializer.data,
@@ -234,25 +383,37 @@ def buyer_join_room(request, room_hash):
 import logging
 logger = logging.getLogger(__name__)
 
+def _throttled_response(retry_after):
+    response = JsonResponse(
+        {"success": False, "error": "Too many failed attempts. Please try again later."}, status=429
+    )
+    response["Retry-After"] = str(retry_after)
+    return response
+
 @require_http_methods(["POST"])
 def seller_authenticate_view(request):
+    # Counted before any password hashing, so over-limit clients never reach it
+    retry_after = throttle.attempt(request, "seller_auth")
+    if retry_after:
+        return _throttled_response(retry_after)
+
     raw_secret_key = request.POST.get("secret_key")
     if not raw_secret_key:
         return JsonResponse({"success": False, "error": "Secret key is required"}, status=400)
 
     try:
         from .models import Seller
-        sellers = Seller.objects.exclude(secret_key__isnull=True)
+        seller = Seller.authenticate(raw_secret_key)
 
-        for seller in sellers:
-            if check_password(raw_secret_key, seller.secret_key):
-                request.session['authenticated_seller_id'] = seller.id
-                logger.info(f"✓ Secret key authenticated: {seller.fullname}")
+        if seller:
+            throttle.release(request, "seller_auth")
+            request.session['authenticated_seller_id'] = seller.id
+            logger.info(f"✓ Secret key authenticated: {seller.fullname}")
 
-                return JsonResponse({
-                    "success": True,
-                    "next_step": "room_hash_required"
-                })
+            return JsonResponse({
+                "success": True,
+                "next_step": "room_hash_required"
+            })
 
         logger.warning("✗ Invalid secret key attempt")
         return JsonResponse({"success": False, "error": "Invalid secret key"}, status=401)
@@ -263,6 +424,10 @@ def seller_authenticate_view(request):
     
 @require_http_methods(["POST"])
 def seller_room_authenticate_view(request):
+    retry_after = throttle.attempt(request, "seller_room_auth")
+    if retry_after:
+        return _throttled_response(retry_after)
+
     room_hash = request.POST.get("room_hash")
     seller_id = request.session.get("authenticated_seller_id")
 
@@ -276,9 +441,14 @@ def seller_room_authenticate_view(request):
         seller = Seller.objects.select_related('room').filter(id=seller_id, room__room_hash=room_hash).first()
 
         if seller:
-            request.session['authenticated_room_hash'] = room_hash
+            throttle.release(request, "seller_room_auth")
+            grant_seller_room(request, room_hash)
             logger.info(f"✓ Room hash verified for seller: {seller.fullname}")
-            return JsonResponse({"success": True, "redirect_url": f"/seller_room/{room_hash}/"})
+            return JsonResponse({
+                "success": True,
+                "redirect_url": f"/seller_room/{room_hash}/",
+                "seller_token": issue_seller_token(room_hash),
+            })
 
         logger.warning("✗ Invalid room hash attempt")
         return JsonResponse({"success": False, "error": "Invalid room hash"}, status=401)
@@ -288,86 +458,61 @@ def seller_room_authenticate_view(request):
         return JsonResponse({"success": False, "error": "Server error occurred"}, status=500)
 
 @api_view(['POST'])
-def buyer_approve_invoice(request, room_hash):
-    room = get_object_or_404(Room, room_hash=room_hash)
-    buyer = getattr(room, 'buyer', None)
-
-    if not buyer or request.data.get('buyer_hash') != buyer.buyer_hash:
-        return Response({'error': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
-
+@buyer_required
+def buyer_approve_invoice(request, room, buyer):
     invoice = room.invoice
-    if invoice.status != 'draft':
-        return Response({'error': 'Invoice not in draft state'}, status=status.HTTP_400_BAD_REQUEST)
-
-    invoice.status = 'pending'
-    invoice.buyer_approved_at = timezone.now()
-    invoice.save()
-
-    NegotiationHistory.objects.create(
-        room=room,
-        action='approved',
-        actor='buyer',
-        notes=f'Invoice {invoice.id} approved by {buyer.fullname}'
+    # Approving is only valid for the exact version the buyer reviewed
+    error = run_transition(
+        invoice, 'approve',
+        notes=f'Invoice {invoice.id} approved by {buyer.fullname}',
+        expected_version=expected_version(request.data),
     )
+    if error:
+        return error
 
-    serializer = RoomDetailSerializer(room, context={'request': request})
+    serializer = RoomDetailSerializer(room.load_details(), context={'request': request})
+    room_cache.bump(room.room_hash)
+    publish_room_state(room.room_hash, 'approved', serializer.data)
     return Response(serializer.data)
 
 
 @api_view(['POST'])
-def buyer_disapprove_invoice(request, room_hash):
-    room = get_object_or_404(Room, room_hash=room_hash)
-    buyer = getattr(room, 'buyer', None)
-
-    if not buyer or request.data.get('buyer_hash') != buyer.buyer_hash:
-        return Response({'error': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
-
-    notes = request.data.get('notes', 'Buyer disapproved')
-
-    invoice = room.invoice
-    invoice.status = 'negotiating'
-    invoice.save()
-
-    NegotiationHistory.objects.create(
-        room=room,
-        action='disapproved',
-        actor='buyer',
-        notes=notes
+@buyer_required
+def buyer_disapprove_invoice(request, room, buyer):
+    error = run_transition(
+        room.invoice, 'disapprove',
+        notes=request.data.get('notes'),
+        expected_version=expected_version(request.data),
     )
+    if error:
+        return error
 
-    serializer = RoomDetailSerializer(room, context={'request': request})
+    serializer = RoomDetailSerializer(room.load_details(), context={'request': request})
+    room_cache.bump(room.room_hash)
+    publish_room_state(room.room_hash, 'disapproved', serializer.data)
     return Response(serializer.data)
 
 
 @api_view(['POST'])
-def buyer_mark_paid(request, room_hash):
-    room = get_object_or_404(Room, room_hash=room_hash)
-    buyer = getattr(room, 'buyer', None)
-
-    if not buyer or request.data.get('buyer_hash') != buyer.buyer_hash:
-        return Response({'error': 'Unauthorized'}, status=status.HTTP_403_FORBIDDEN)
-
-    invoice = room.invoice
-    if invoice.status != 'pending':
-        return Response({'error': 'Invoice must be in pending status'}, status=status.HTTP_400_BAD_REQUEST)
-
-    invoice.status = 'unconfirmed_payment'
-    invoice.buyer_paid_at = timezone.now()
-    invoice.save()
-
-    NegotiationHistory.objects.create(
-        room=room,
-        action='paid',
-        actor='buyer',
-        notes=f'Buyer {buyer.fullname} marked invoice as paid'
+@buyer_required
+def buyer_mark_paid(request, room, buyer):
+    error = run_transition(
+        room.invoice, 'mark_paid',
+        notes=f'Buyer {buyer.fullname} marked invoice as paid',
+        expected_version=expected_version(request.data),
     )
+    if error:
+        return error
 
-    serializer = RoomDetailSerializer(room, context={'request': request})
+    serializer = RoomDetailSerializer(room.load_details(), context={'request': request})
+    room_cache.bump(room.room_hash)
+    publish_room_state(room.room_hash, 'paid', serializer.data)
     return Response(serializer.data)
 
 @api_view(['PUT'])
+@seller_token_required
 def seller_edit_invoice(request, room_hash):
-    room = get_object_or_404(Room, room_hash=room_hash)
+    room = get_object_or_404(Room.objects.with_parties(), room_hash=room_hash)
     invoice = room.invoice
     data = request.data or {}
 
@@ -377,27 +522,25 @@ def seller_edit_invoice(request, room_hash):
         serializer = SingleInvoiceSerializer(invoice, data=data, partial=True)
 
     if serializer.is_valid():
-        with transaction.atomic():
-            invoice = serializer.save()
-            invoice.status = 'draft'
-            invoice.save(update_fields=['status'])
-
-            NegotiationHistory.objects.create(
-                room=room,
-                action='edited',
-                actor='seller',
-                notes='Invoice edited by seller'
-            )
+        fields = dict(serializer.validated_data)
+        error = apply_seller_edit(
+            invoice, fields, items_data=fields.pop('items', None), expected_version=expected_version(data)
+        )
+        if error:
+            return error
 
-        room_serializer = RoomDetailSerializer(room, context={'request': request})
+        room_serializer = RoomDetailSerializer(room.load_details(), context={'request': request})
+        room_cache.bump(room.room_hash)
+        publish_room_state(room.room_hash, 'edited', room_serializer.data)
         return Response(room_serializer.data)
 
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 @api_view(['PUT'])
+@seller_token_required
 def seller_edit_single_invoice(request, room_hash):
-    room = get_object_or_404(Room, room_hash=room_hash)
+    room = get_object_or_404(Room.objects.with_parties(), room_hash=room_hash)
     invoice = room.invoice
     data = request.data or {}
 
@@ -414,88 +557,52 @@ def seller_edit_single_invoice(request, room_hash):
             return None
 
     allowed = ['invoice_date', 'due_date', 'description', 'quantity', 'unit_price', 'payment_method']
-    updated = False
-
-    with transaction.atomic():
-        for key in allowed:
-            if key in data:
-                if key == 'quantity':
-                    coerced = to_int(data.get(key))
-                    if coerced is None:
-                        return Response({key: ['Invalid integer value']}, status=status.HTTP_400_BAD_REQUEST)
-                    setattr(invoice, key, coerced)
-                elif key == 'unit_price':
-                    coerced = to_decimal(data.get(key))
-                    if coerced is None:
-                        return Response({key: ['Invalid decimal value']}, status=status.HTTP_400_BAD_REQUEST)
-                    setattr(invoice, key, coerced)
-                else:
-                    setattr(invoice, key, data.get(key))
-                updated = True
-
-        if updated:
-            invoice.status = 'draft'
-            invoice.save()
-            NegotiationHistory.objects.create(
-                room=room,
-                action='edited',
-                actor='seller',
-                notes='Invoice edited by seller (single-item)'
-            )
-
-    room_serializer = RoomDetailSerializer(room, context={'request': request})
+    fields = {}
+    version = expected_version(data)
+
+    for key in allowed:
+        if key in data:
+            if key == 'quantity':
+                coerced = to_int(data.get(key))
+                if coerced is None:
+                    return Response({key: ['Invalid integer value']}, status=status.HTTP_400_BAD_REQUEST)
+                fields[key] = coerced
+            elif key == 'unit_price':
+                coerced = to_decimal(data.get(key))
+                if coerced is None:
+                    return Response({key: ['Invalid decimal value']}, status=status.HTTP_400_BAD_REQUEST)
+                fields[key] = coerced
+            else:
+                fields[key] = data.get(key)
+
+    if fields:
+        error = apply_seller_edit(
+            invoice, fields, expected_version=version, notes='Invoice edited by seller (single-item)'
+        )
+        if error:
+            return error
+
+    room_serializer = RoomDetailSerializer(room.load_details(), context={'request': request})
+    room_cache.bump(room.room_hash)
+    publish_room_state(room.room_hash, 'edited', room_serializer.data)
     return Response(room_serializer.data)
 
 
 
-@api_view(['POST'])
-def buyer_mark_paid(request, room_hash):
-    room = get_object_or_404(Room, room_hash=room_hash)
-    invoice = room.invoice
-    
-    if invoice.status != 'pending':
-        return Response(
-            {'error': 'Invoice must be in pending status'}, 
-            status=status.HTTP_400_BAD_REQUEST
-        )
-    
-    invoice.status = 'unconfirmed_payment'
-    invoice.buyer_paid_at = timezone.now()
-    invoice.save()
-    
-    NegotiationHistory.objects.create(
-        room=room,
-        action='paid',
-        actor='buyer',
-        notes='Buyer marked as paid'
-    )
-    
-    serializer = RoomDetailSerializer(room, context={'request': request})
-    return Response(serializer.data)
 
 @api_view(['POST'])
+@seller_token_required
 def seller_confirm_payment(request, room_hash):
-    room = get_object_or_404(Room, room_hash=room_hash)
+    room = get_object_or_404(Room.objects.with_parties(), room_hash=room_hash)
     invoice = room.invoice
+    error = run_transition(invoice, 'confirm_payment', expected_version=expected_version(request.data))
+    if error:
+        return error
+    prerender.schedule(room.room_hash, base_url_for(request))
     
-    if invoice.status != 'unconfirmed_payment':
-        return Response(
-            {'error': 'Invoice must be in unconfirmed payment status'}, 
-            status=status.HTTP_400_BAD_REQUEST
-        )
-    
-    invoice.status = 'finalized'
-    invoice.seller_confirmed_at = timezone.now()
-    invoice.save()
-    
-    NegotiationHistory.objects.create(
-        room=room,
-        action='confirmed',
-        actor='seller',
-        notes='Seller confirmed payment received'
-    )
-    
-    serializer = RoomDetailSerializer(room, context={'request': request})
+    serializer = RoomDetailSerializer(room.load_details(), context={'request': request})
+    room_cache.bump(room.room_hash)
+    publish_room_state(room.room_hash, 'confirmed', serializer.data)
     return Response({
         "success": True,
         "invoice_status": invoice.status,
@@ -507,32 +614,38 @@ def seller_confirm_payment(request, room_hash):
 from decimal import Decimal
 
 @api_view(['POST'])
+@seller_token_required
 def update_invoice(request, room_hash):
-    room = get_object_or_404(Room, room_hash=room_hash)
+    room = get_object_or_404(Room.objects.with_parties(), room_hash=room_hash)
 
     if not hasattr(room, 'invoice'):
         return Response({'error': 'No invoice found for this room'}, status=status.HTTP_404_NOT_FOUND)
 
     invoice = room.invoice
+    version = expected_version(request.data)
 
     try:
+        fields = {}
         if 'invoice_date' in request.data:
-            invoice.invoice_date = request.data['invoice_date']
+            fields['invoice_date'] = request.data['invoice_date']
         if 'due_date' in request.data:
-            invoice.due_date = request.data['due_date']
+            fields['due_date'] = request.data['due_date']
         if 'description' in request.data:
-            invoice.description = request.data['description']
+            fields['description'] = request.data['description']
         if 'quantity' in request.data:
-            invoice.quantity = int(request.data['quantity'])
+            fields['quantity'] = int(request.data['quantity'])
         if 'unit_price' in request.data:
-            invoice.unit_price = Decimal(request.data['unit_price'])
+            fields['unit_price'] = Decimal(request.data['unit_price'])
         if 'payment_method' in request.data:
-            invoice.payment_method = request.data['payment_method']
+            fields['payment_method'] = request.data['payment_method']
 
-        invoice.status = 'draft'
-        invoice.save()
+        error = apply_seller_edit(invoice, fields, expected_version=version)
+        if error:
+            return error
 
-        serializer = RoomDetailSerializer(room, context={'request': request})
+        serializer = RoomDetailSerializer(room.load_details(), context={'request': request})
+        room_cache.bump(room.room_hash)
+        publish_room_state(room.room_hash, 'edited', serializer.data)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
     except Exception as e:
@@ -540,7 +653,7 @@ def update_invoice(request, room_hash):
 
 @api_view(['GET'])
 def verify_invoice(request, room_hash):
-    room = get_object_or_404(Room, room_hash=room_hash)
+    room = get_object_or_404(Room.objects.with_parties(), room_hash=room_hash)
     verification_key = request.query_params.get('key')
     
     if not verification_key or verification_key != room.verification_key:
@@ -549,12 +662,12 @@ def verify_invoice(request, room_hash):
             status=status.HTTP_403_FORBIDDEN
         )
     
-    serializer = RoomDetailSerializer(room, context={'request': request})
+    serializer = RoomDetailSerializer(room.load_details(), context={'request': request})
     return Response(serializer.data)
 
 @api_view(['GET'])
 def download_invoice_pdf(request, room_hash):
-    room = get_object_or_404(Room, room_hash=room_hash)
+    room = get_object_or_404(Room.objects.with_parties(), room_hash=room_hash)
     
     if room.invoice.status != 'finalized':
         return Response(
@@ -0,0 +1,50 @@
+"""
+Messages clients may send over the negotiation WebSocket.
+
+Every client frame is a JSON object with a ``type`` from MESSAGE_TYPES and
+only the fields listed for it. ``parse()`` returns the normalized message
+or None, and anything it rejects is dropped without being relayed:
+
+    {"type": "typing", "active": true}
+    {"type": "presence", "status": "online"}
+
+Clients never say who they are: the consumer adds ``actor`` from the role
+the connection authenticated as. Room state and state-change notices are
+never taken from clients; they are published by the server after each
+write (see realtime.publish_room_state). Only the latest message of each
+type matters, so the consumer coalesces bursts.
+"""
+import json
+
+PRESENCE_STATUSES = ('online', 'away')
+
+# type -> {field: validator}
+MESSAGE_TYPES = {
+    'typing': {
+        'active': lambda value: isinstance(value, bool),
+    },
+    'presence': {
+        'status': lambda value: value in PRESENCE_STATUSES,
+    },
+}
+
+DEFAULT_MAX_BYTES = 1024
+
+
+def parse(text, max_bytes=DEFAULT_MAX_BYTES):
+    """Return the validated message in ``text``, or None if it must be dropped"""
+    if not text or len(text.encode()) > max_bytes:
+        return None
+    try:
+        message = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(message, dict) or not isinstance(message.get('type'), str):
+        return None
+
+    fields = MESSAGE_TYPES.get(message['type'])
+    if fields is None or set(message) != {'type', *fields}:
+        return None
+    if not all(valid(message[name]) for name, valid in fields.items()):
+        return None
+    return message